@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of the per request encoding and signing cost
+
+    python -m benchmarks.bench_signing
+"""
+
+import argparse
+import hashlib
+import hmac
+import timeit
+import urllib.parse
+
+from asyncoinpayments.signing import RequestSigner
+
+PRIVATE_KEY = "f" * 64
+PUBLIC_KEY = "a" * 64
+PARAMS = {"txid": "CPFE0ABCDEFGHIJKLMNOPQRSTU", "full": 0}
+
+
+def sign_baseline(cmd: str, params: dict) -> tuple:
+    """
+    the previous path, the whole body is urlencoded and the hmac keyed every time
+    """
+
+    base_params = {"cmd": cmd, "key": PUBLIC_KEY, "version": "1", "format": "json"}
+    encoded = urllib.parse.urlencode({**base_params, **params}).encode("utf-8")
+    h = hmac.new(bytearray(PRIVATE_KEY, "utf-8"), encoded, hashlib.sha512).hexdigest()
+    return encoded, h
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=100_000)
+    args = parser.parse_args()
+
+    signer = RequestSigner(PRIVATE_KEY, PUBLIC_KEY, "1", "json")
+
+    def sign_fast(cmd: str, params: dict) -> tuple:
+        encoded = signer.encode(cmd, params)
+        return encoded, signer.sign(encoded)
+
+    # both paths must produce the same signed body
+    assert sign_fast("get_tx_info", PARAMS) == sign_baseline("get_tx_info", PARAMS)
+
+    for name, func in (("baseline", sign_baseline), ("signer", sign_fast)):
+        seconds = min(
+            timeit.repeat(
+                lambda: func("get_tx_info", PARAMS), number=args.number, repeat=5
+            )
+        )
+        print(f"{name:>8}: {seconds / args.number * 1e6:.2f} us/request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Local stand-in for the CoinPayments api.php endpoint
+
+    python -m benchmarks.mock_server --port 8080
+
+It verifies the HMAC of every request, serves realistic payloads of
+configurable size and can inject latency and errors
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import random
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+from . import payloads
+
+PRIVATE_KEY = "f" * 64
+PUBLIC_KEY = "a" * 64
+
+
+class MockCoinPayments:
+    def __init__(
+        self,
+        private_key: str = PRIVATE_KEY,
+        coins: int = 500,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        private_key : str, optional
+            the private key used to verify the requests, by default PRIVATE_KEY
+        coins : int, optional
+            the number of currencies in the rates and balances payloads, by default 500
+        latency : float, optional
+            seconds waited before answering each request, by default 0.0
+        jitter : float, optional
+            random extra seconds, up to this value, added to the latency, by default 0.0
+        error_rate : float, optional
+            the fraction of requests answered with an HTTP 500, by default 0.0
+        """
+
+        self._hmac = hmac.new(private_key.encode("utf-8"), digestmod=hashlib.sha512)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.requests = 0
+
+        # the large payloads are encoded once, like a real server cache would
+        self._static = {
+            "rates": self._encode(payloads.rates(coins, seed)),
+            "balances": self._encode(payloads.balances(coins, seed)),
+        }
+        self._seed = seed
+
+    @staticmethod
+    def _encode(result) -> bytes:
+        return json.dumps({"error": "ok", "result": result}).encode("utf-8")
+
+    def _body(self, cmd: str, params: dict) -> bytes:
+        static = self._static.get(cmd)
+        if static is not None:
+            return static
+
+        if cmd == "get_tx_info":
+            return self._encode(payloads.tx_info(params.get("txid", ""), self._seed))
+        if cmd == "get_tx_info_multi":
+            txids = params.get("txid", "").split("|")
+            return self._encode(
+                {
+                    txid: {"error": "ok", **payloads.tx_info(txid, self._seed)}
+                    for txid in txids
+                }
+            )
+
+        return self._encode({})
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.read()
+
+        h = self._hmac.copy()
+        h.update(body)
+        if not hmac.compare_digest(h.hexdigest(), request.headers.get("hmac", "")):
+            return web.json_response({"error": "HMAC signature does not match"})
+
+        delay = self.latency + self._random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self._random.random() < self.error_rate:
+            return web.Response(status=500, text="Internal Server Error")
+
+        params = dict(parse_qsl(body.decode("utf-8")))
+        return web.Response(
+            body=self._body(params.get("cmd", ""), params),
+            content_type="application/json",
+        )
+
+    async def handle_head(self, request: web.Request) -> web.Response:
+        return web.Response()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api.php", self.handle)
+        app.router.add_head("/api.php", self.handle_head)
+        return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock CoinPayments api server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--coins", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    mock = MockCoinPayments(
+        coins=args.coins,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+    )
+    web.run_app(mock.app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Realistic api payloads of configurable size for the mock server
+"""
+
+import random
+import time
+from typing import Dict, List
+
+FIATS = ["USD", "EUR", "GBP", "CAD", "AUD", "JPY", "CHF", "CNY"]
+
+
+def coin_codes(coins: int) -> List[str]:
+    """
+    BTC, the fiat currencies and then synthetic coin codes up to coins currencies
+    """
+
+    codes = ["BTC", *FIATS]
+    codes.extend(f"C{i:04d}" for i in range(coins - len(codes)))
+    return codes[:coins]
+
+
+def rates(coins: int, seed: int = 0) -> Dict[str, dict]:
+    rng = random.Random(seed)
+    now = str(int(time.time()))
+    result = {}
+
+    for code in coin_codes(coins):
+        is_fiat = code in FIATS
+        result[code] = {
+            "is_fiat": 1 if is_fiat else 0,
+            "rate_btc": (
+                "1.000000000000000000000000"
+                if code == "BTC"
+                else f"{rng.uniform(1e-8, 0.05):.24f}"
+            ),
+            "last_update": now,
+            "tx_fee": "0.00000000" if is_fiat else f"{rng.uniform(0, 0.01):.8f}",
+            "status": "online",
+            "name": f"Currency {code}",
+            "confirms": "0" if is_fiat else str(rng.randint(1, 30)),
+            "can_convert": 0 if is_fiat else 1,
+            "capabilities": [] if is_fiat else ["payments", "wallet", "transfers"],
+            "accepted": 1,
+        }
+
+    return result
+
+
+def balances(coins: int, seed: int = 0) -> Dict[str, dict]:
+    rng = random.Random(seed)
+    result = {}
+
+    for code in coin_codes(coins):
+        if code in FIATS:
+            continue
+        satoshis = rng.randint(0, 10**10)
+        result[code] = {
+            "balance": satoshis,
+            "balancef": f"{satoshis / 1e8:.8f}",
+            "status": "available",
+            "coin_status": "online",
+        }
+
+    return result
+
+
+def tx_info(txid: str, seed: int = 0) -> dict:
+    rng = random.Random(f"{seed}{txid}")
+    satoshis = rng.randint(10**4, 10**9)
+    status = rng.choice([0, 1, 100, -1])
+    now = int(time.time())
+
+    return {
+        "time_created": now - 3600,
+        "time_expires": now + 3600,
+        "status": status,
+        "status_text": {0: "Waiting for buyer funds...", 1: "Funds received"}.get(
+            status, "Complete" if status == 100 else "Cancelled / Timed Out"
+        ),
+        "type": "coins",
+        "coin": "BTC",
+        "amount": satoshis,
+        "amountf": f"{satoshis / 1e8:.8f}",
+        "received": satoshis if status == 100 else 0,
+        "receivedf": f"{satoshis / 1e8 if status == 100 else 0:.8f}",
+        "recv_confirms": 3 if status == 100 else 0,
+        "payment_address": f"bc1q{rng.getrandbits(160):040x}",
+    }
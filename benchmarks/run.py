@@ -0,0 +1,238 @@
+"""
+Drive AsynCoinPayments against the mock server at fixed concurrency levels
+
+    python -m benchmarks.run --cmd rates --concurrency 1 10 50 --output run.json
+    python -m benchmarks.run --cmd rates --compare run.json
+
+Reports the throughput, the p50/p95/p99 latency and the memory allocated per
+call, the results are saved as JSON so that runs can be compared
+"""
+
+import argparse
+import asyncio
+import json
+import platform
+import time
+import tracemalloc
+from typing import Awaitable, Callable, Dict, List
+
+from aiohttp import web
+
+from asyncoinpayments import AsynCoinPayments
+
+from .mock_server import PRIVATE_KEY, PUBLIC_KEY, MockCoinPayments
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def command(client: AsynCoinPayments, cmd: str) -> Callable[[int], Awaitable]:
+    if cmd == "rates":
+        return lambda i: client.rates()
+    if cmd == "balances":
+        return lambda i: client.balances()
+    if cmd == "get_tx_info":
+        return lambda i: client.get_tx_info(f"CPTX{i:010d}")
+    if cmd == "get_tx_info_multi":
+        return lambda i: client.get_tx_info_multi(
+            f"CPTX{i * 25 + j:010d}" for j in range(25)
+        )
+    raise SystemExit(f"unsupported cmd {cmd}")
+
+
+async def run_level(
+    client: AsynCoinPayments, cmd: str, concurrency: int, requests: int
+) -> Dict[str, float]:
+    call = command(client, cmd)
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                await call(i)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput_rps": requests / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1e3,
+        "p95_ms": percentile(latencies, 95) * 1e3,
+        "p99_ms": percentile(latencies, 99) * 1e3,
+    }
+
+
+async def measure_allocations(
+    client: AsynCoinPayments, cmd: str, calls: int
+) -> Dict[str, float]:
+    """
+    the peak memory traced during a single call and the blocks still held after it,
+    averaged over sequential calls
+    """
+
+    call = command(client, cmd)
+    await call(0)  # let the caches and the connection settle first
+
+    tracemalloc.start()
+    peak = 0
+    before = tracemalloc.take_snapshot()
+
+    for i in range(calls):
+        tracemalloc.reset_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        await call(i)
+        peak += tracemalloc.get_traced_memory()[1] - current
+
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+    return {
+        "alloc_peak_kib_per_call": peak / calls / 1024,
+        "retained_blocks_per_call": retained / calls,
+    }
+
+
+async def benchmark(args: argparse.Namespace) -> dict:
+    runner = None
+
+    if args.url is None:
+        mock = MockCoinPayments(
+            coins=args.coins,
+            latency=args.latency,
+            jitter=args.jitter,
+            error_rate=args.error_rate,
+        )
+        runner = web.AppRunner(mock.app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        url = f"http://127.0.0.1:{port}/api.php"
+    else:
+        url = args.url
+
+    results = []
+    try:
+        async with AsynCoinPayments(
+            PRIVATE_KEY,
+            PUBLIC_KEY,
+            lazy_json=args.lazy_json,
+            # every request of a level must reach the server to be measured
+            coalesce=args.coalesce,
+        ) as client:
+            client.base_url = url
+            await client.warmup(min(max(args.concurrency), 20))
+
+            for concurrency in args.concurrency:
+                level = await run_level(client, args.cmd, concurrency, args.requests)
+                results.append(level)
+
+            allocations = await measure_allocations(client, args.cmd, args.alloc_calls)
+    finally:
+        if runner is not None:
+            await runner.cleanup()
+
+    return {
+        "meta": {
+            "cmd": args.cmd,
+            "coins": args.coins,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "error_rate": args.error_rate,
+            "lazy_json": args.lazy_json,
+            "coalesce": args.coalesce,
+            "python": platform.python_version(),
+            "timestamp": time.time(),
+        },
+        "allocations": allocations,
+        "results": results,
+    }
+
+
+def report(run: dict, baseline: dict = None) -> None:
+    base_levels = {}
+    if baseline is not None:
+        base_levels = {r["concurrency"]: r for r in baseline["results"]}
+
+    print(f"cmd={run['meta']['cmd']} coins={run['meta']['coins']}")
+    print(f"{'conc':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} errors")
+
+    for r in run["results"]:
+        line = (
+            f"{r['concurrency']:>6} {r['throughput_rps']:>10.1f} {r['p50_ms']:>9.2f}"
+            f" {r['p95_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['errors']:>6}"
+        )
+        base = base_levels.get(r["concurrency"])
+        if base is not None:
+            change = r["throughput_rps"] / base["throughput_rps"] - 1
+            line += f"  ({change:+.1%} req/s vs baseline)"
+        print(line)
+
+    allocations = run["allocations"]
+    print(
+        f"allocations: {allocations['alloc_peak_kib_per_call']:.1f} KiB peak/call,"
+        f" {allocations['retained_blocks_per_call']:.1f} retained blocks/call"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AsynCoinPayments benchmark")
+    parser.add_argument(
+        "--cmd",
+        default="rates",
+        choices=["rates", "balances", "get_tx_info", "get_tx_info_multi"],
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--coins", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--alloc-calls", type=int, default=50)
+    parser.add_argument("--lazy-json", action="store_true")
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="let identical concurrent reads share a request, off by default",
+    )
+    parser.add_argument(
+        "--url", default=None, help="target an already running mock server"
+    )
+    parser.add_argument("--output", default=None, help="save the results as JSON")
+    parser.add_argument("--compare", default=None, help="a previous JSON result")
+    args = parser.parse_args()
+
+    run = asyncio.run(benchmark(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report(run, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
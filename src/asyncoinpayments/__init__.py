@@ -1,2 +1,12 @@
+from .breaker import CircuitBreaker
+from .cache import ResponseCache
 from .coinpayments import AsynCoinPayments
-from .utils import ApiResponseJson, JsonResponse
+from .hedging import HedgePolicy
+from .metrics import MetricsCollector, RequestObserver
+from .models import Balance, Rate, TxInfo, WithdrawalInfo
+from .pool import AsynCoinPaymentsPool
+from .rates import RatesSnapshot
+from .retry import RetryPolicy
+from .scheduler import RequestScheduler
+from .utils import ApiResponseJson, JsonResponse, LazyJsonResponse
+from .warmstart import WarmStart
@@ -0,0 +1,238 @@
+"""
+Run a batch of api commands concurrently
+
+    python -m asyncoinpayments commands.jsonl > results.jsonl
+    cat commands.jsonl | python -m asyncoinpayments --concurrency 16 --rate 20
+
+Every input line is a JSON record ``{"cmd": ..., "params": {...}}``, an optional
+``id`` field is copied to its result. Each result is written to stdout as a JSON
+line with the index of its input line, the api error and result, in input order
+or with ``--unordered`` as soon as it completes. The keys are read from the
+COINPAYMENTS_PRIVATE_KEY and COINPAYMENTS_PUBLIC_KEY environment variables
+unless they are passed explicitly.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import IO, Dict, List, Optional, Tuple
+
+from .coinpayments import AsynCoinPayments
+from .scheduler import RequestScheduler
+
+
+def parse_record(line: str) -> Tuple[str, dict, object]:
+    """
+    the cmd, params and id of an input line, raises ValueError when it is malformed
+    """
+
+    record = json.loads(line)
+    if not isinstance(record, dict) or not isinstance(record.get("cmd"), str):
+        raise ValueError("the record must be an object with a cmd string")
+
+    params = record.get("params") or {}
+    if not isinstance(params, dict):
+        raise ValueError("params must be an object")
+
+    return record["cmd"], params, record.get("id")
+
+
+class BatchRunner:
+    """
+    Feeds the input records to a fixed number of workers and writes their results,
+    at most ``window`` records are read ahead of the last result written, so a slow
+    command can't make the ordered output buffer grow without bound
+    """
+
+    def __init__(
+        self,
+        client: AsynCoinPayments,
+        concurrency: int = 8,
+        ordered: bool = True,
+        window: int = None,
+    ) -> None:
+        self.client = client
+        self.concurrency = concurrency
+        self.ordered = ordered
+        self.window = window or concurrency * 4
+
+        self.total = 0
+        self.ok = 0
+        self.api_errors = 0
+        self.failed = 0
+        self.latencies: List[float] = []
+
+    async def run(self, source: IO[str], sink: IO[str]) -> None:
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        window = asyncio.Semaphore(self.window)
+        pending: Dict[int, dict] = {}
+        next_index = 0
+
+        def write(result: dict) -> None:
+            sink.write(json.dumps(result, default=str) + "\n")
+            window.release()
+
+        def emit(index: int, result: dict) -> None:
+            nonlocal next_index
+            if not self.ordered:
+                write(result)
+                return
+
+            pending[index] = result
+            while next_index in pending:
+                write(pending.pop(next_index))
+                next_index += 1
+
+        async def produce() -> None:
+            index = 0
+            while True:
+                # stdin is read off the event loop so the workers keep running
+                line = await loop.run_in_executor(None, source.readline)
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                await window.acquire()
+                await queue.put((index, line))
+                index += 1
+
+            for _ in range(self.concurrency):
+                await queue.put(None)
+
+        async def work() -> None:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                index, line = item
+                emit(index, await self.execute(index, line))
+
+        await asyncio.gather(produce(), *(work() for _ in range(self.concurrency)))
+        sink.flush()
+
+    async def execute(self, index: int, line: str) -> dict:
+        self.total += 1
+        result = {"index": index}
+
+        try:
+            cmd, params, record_id = parse_record(line)
+        except ValueError as e:
+            self.failed += 1
+            result.update(error=f"invalid record: {e}", result=None)
+            return result
+
+        if record_id is not None:
+            result["id"] = record_id
+        result["cmd"] = cmd
+
+        start = time.perf_counter()
+        try:
+            response = await self.client.api_call(cmd, **params)
+        except Exception as e:
+            self.failed += 1
+            result.update(error=f"{type(e).__name__}: {e}", result=None)
+        else:
+            if response.error == "ok":
+                self.ok += 1
+            else:
+                self.api_errors += 1
+            result.update(error=response.error, result=response.result)
+
+        elapsed = time.perf_counter() - start
+        self.latencies.append(elapsed)
+        result["seconds"] = round(elapsed, 6)
+        return result
+
+    def summary(self, elapsed: float) -> str:
+        ordered = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+        return (
+            f"{self.total} commands in {elapsed:.2f}s"
+            f" ({self.total / elapsed if elapsed else 0.0:.1f} cmd/s):"
+            f" {self.ok} ok, {self.api_errors} api errors, {self.failed} failed,"
+            f" latency p50 {percentile(50) * 1e3:.1f} ms"
+            f" p95 {percentile(95) * 1e3:.1f} ms"
+            f" p99 {percentile(99) * 1e3:.1f} ms"
+        )
+
+
+async def run(args: argparse.Namespace) -> int:
+    scheduler = None
+    if args.rate > 0:
+        scheduler = RequestScheduler(
+            rate=args.rate, burst=args.burst, max_in_flight=args.concurrency
+        )
+
+    source = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        async with AsynCoinPayments(
+            args.private_key,
+            args.public_key,
+            connection_limit=args.concurrency,
+            scheduler=scheduler,
+            timeout=args.timeout,
+        ) as client:
+            if args.url is not None:
+                client.base_url = args.url
+
+            runner = BatchRunner(client, args.concurrency, not args.unordered)
+            start = time.perf_counter()
+            await runner.run(source, sys.stdout)
+            elapsed = time.perf_counter() - start
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+    print(runner.summary(elapsed), file=sys.stderr)
+    return 0 if runner.failed == 0 and runner.api_errors == 0 else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m asyncoinpayments",
+        description="run a JSONL batch of CoinPayments api commands",
+    )
+    parser.add_argument(
+        "input", nargs="?", default="-", help="the JSONL commands, by default stdin"
+    )
+    parser.add_argument(
+        "--private-key", default=os.environ.get("COINPAYMENTS_PRIVATE_KEY")
+    )
+    parser.add_argument(
+        "--public-key", default=os.environ.get("COINPAYMENTS_PUBLIC_KEY")
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument(
+        "--rate", type=float, default=10.0, help="requests per second, 0 to disable"
+    )
+    parser.add_argument("--burst", type=float, default=None)
+    parser.add_argument(
+        "--timeout", type=float, default=None, help="the deadline of each command"
+    )
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="write the results as they complete instead of in input order",
+    )
+    parser.add_argument("--url", default=None, help="override the api endpoint")
+    args = parser.parse_args(argv)
+
+    if not args.private_key or not args.public_key:
+        parser.error("the private and public keys are required")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    return asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Reserve of pre-generated callback addresses for the checkout path
+
+The addresses are generated in the background ahead of their use, so handing one out
+at checkout doesn't wait for the api. The size of the reserve of each currency
+follows how fast its addresses are used, and the unused addresses are kept in a
+journal file so that they survive a restart
+"""
+
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, List, Tuple, TypeVar
+
+from .coinpayments import AsynCoinPayments
+from .commands import PRIORITY_LOW
+from .errors import CoinPayementsError, CoinPaymentsInputError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class AddressPool:
+    """
+    Per currency reserves of fresh callback addresses, topped up in the background
+
+    Each reserve holds enough addresses for ``lead_time`` seconds of the recent
+    consumption rate of its currency, within min_reserve and max_reserve, and is
+    refilled in batches of ``concurrency`` calls whenever it falls under half of that
+    target or every check_interval seconds, in the low priority lane of the
+    scheduler so that checkouts go first. When a reserve is empty the address is
+    requested inline. The addresses added and handed out are appended to a journal
+    file, an address handed out is never served again after a restart. Addresses
+    are told apart by their address and dest_tag, the currencies using a dest_tag
+    share a single address
+    """
+
+    def __init__(
+        self,
+        client: AsynCoinPayments,
+        currencies: Iterable[str],
+        ipn_url: str = None,
+        path: str = None,
+        min_reserve: int = 5,
+        max_reserve: int = 100,
+        lead_time: float = 600.0,
+        rate_window: float = 900.0,
+        concurrency: int = 2,
+        check_interval: float = 30.0,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        client : AsynCoinPayments
+            the client generating the addresses
+        currencies : Iterable[str]
+            the currencies to keep a reserve of
+        ipn_url : str, optional
+            the ipn url of the addresses, by default the one set in the merchant settings
+        path : str, optional
+            the journal file of the reserves, if not set they are only kept in memory, by default None
+        min_reserve : int, optional
+            the minimum number of addresses kept for each currency, by default 5
+        max_reserve : int, optional
+            the maximum number of addresses kept for each currency, by default 100
+        lead_time : float, optional
+            the reserve holds the addresses used in this many seconds at the recent rate, by default 600.0
+        rate_window : float, optional
+            the time constant in seconds of the consumption rate average, by default 900.0
+        concurrency : int, optional
+            the maximum number of addresses requested at the same time, by default 2
+        check_interval : float, optional
+            the maximum number of seconds between two refills, by default 30.0
+        """
+
+        self.client = client
+        self.currencies = list(currencies)
+        self.ipn_url = ipn_url
+        self.path = path
+        self.min_reserve = min_reserve
+        self.max_reserve = max_reserve
+        self.lead_time = lead_time
+        self.rate_window = rate_window
+        self.concurrency = concurrency
+        self.check_interval = check_interval
+
+        self._reserves: Dict[str, Deque[dict]] = {c: deque() for c in self.currencies}
+        # currency -> (rate, time of the last update)
+        self._rates: Dict[str, Tuple[float, float]] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # created in start, before python 3.10 it binds to the event loop current
+        # when it is built
+        self._wakeup: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+    def __len__(self) -> int:
+        return sum(len(reserve) for reserve in self._reserves.values())
+
+    def reserve(self, currency: str) -> int:
+        """
+        the number of addresses ready for currency
+        """
+
+        reserve = self._reserves.get(currency)
+        return len(reserve) if reserve is not None else 0
+
+    def rate(self, currency: str) -> float:
+        """
+        the recent number of addresses of currency used per second
+        """
+
+        rate, updated = self._rates.get(currency, (0.0, 0.0))
+        return rate * math.exp(-(time.monotonic() - updated) / self.rate_window)
+
+    def target(self, currency: str) -> int:
+        """
+        the number of addresses the reserve of currency is refilled to
+        """
+
+        wanted = math.ceil(self.rate(currency) * self.lead_time)
+        return min(self.max_reserve, max(self.min_reserve, wanted))
+
+    def _wake(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _record_use(self, currency: str) -> None:
+        # exponentially decaying count of the uses, divided by its time constant
+        self._rates[currency] = (
+            self.rate(currency) + 1 / self.rate_window,
+            time.monotonic(),
+        )
+
+    async def get(self, currency: str) -> dict:
+        """
+        hand out a fresh callback address of currency
+
+        Returns
+        -------
+        dict
+            the result of get_callback_address, with its address and when needed its pubkey and dest_tag
+
+        Raises
+        ------
+        CoinPaymentsInputError
+            the currency is not pooled
+        CoinPayementsError
+            the reserve is empty and the api failed to create an address
+        """
+
+        reserve = self._reserves.get(currency)
+        if reserve is None:
+            raise CoinPaymentsInputError(f"{currency} addresses are not pooled")
+
+        self._record_use(currency)
+
+        if reserve:
+            self.hits += 1
+            address = reserve.popleft()
+            self._journal(
+                [{"used": address["address"], "dest_tag": address.get("dest_tag")}]
+            )
+            if len(reserve) < self.target(currency) // 2:
+                self._wake()
+            return address
+
+        self.misses += 1
+        self._wake()
+        return await self._generate(currency)
+
+    async def _generate(self, currency: str, priority: int = None) -> dict:
+        response = await self.client.get_callback_address(
+            currency, self.ipn_url, priority=priority
+        )
+        response.raise_for_errors()
+        return dict(response.result)
+
+    async def refill(self) -> None:
+        """
+        top up every reserve to its target, a reserve is left as is for this round
+        once one of its calls fails
+        """
+
+        for currency in self.currencies:
+            reserve = self._reserves[currency]
+
+            while len(reserve) < self.target(currency):
+                batch = min(self.concurrency, self.target(currency) - len(reserve))
+                results = await asyncio.gather(
+                    *(self._generate(currency, PRIORITY_LOW) for _ in range(batch)),
+                    return_exceptions=True,
+                )
+
+                addresses = [r for r in results if isinstance(r, dict)]
+                reserve.extend(addresses)
+                self._journal([{"currency": currency, **a} for a in addresses])
+
+                errors = [r for r in results if isinstance(r, BaseException)]
+                if errors:
+                    logger.warning(
+                        "refilling %s addresses failed: %s", currency, errors[0]
+                    )
+                    break
+
+    async def _run(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                await self.refill()
+            except (CoinPayementsError, asyncio.TimeoutError) as e:
+                logger.warning("refilling the address pool failed: %s", e)
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.check_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    ### PERSISTENCE
+
+    async def _run_in_executor(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _journal(self, records: List[dict]) -> None:
+        """
+        append records to the journal, the writes are queued in order on the
+        journal thread without waiting for them
+        """
+
+        if self.path is None or not records:
+            return
+
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        future = asyncio.get_running_loop().run_in_executor(
+            self._executor, self._append, lines
+        )
+        future.add_done_callback(self._journal_failed)
+
+    @staticmethod
+    def _journal_failed(future: asyncio.Future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("writing the address journal failed: %s", future.exception())
+
+    def _append(self, lines: str) -> None:
+        with open(self.path, "a") as f:
+            f.write(lines)
+
+    def _load(self) -> Dict[str, List[dict]]:
+        """
+        replay the journal, then rewrite it with only the unused addresses
+        """
+
+        unused: Dict[Tuple[str, Any], dict] = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # torn by a crash while appending
+                    # (address, dest_tag), the tag tells apart the shared addresses
+                    if "used" in record:
+                        unused.pop((record["used"], record.get("dest_tag")), None)
+                    else:
+                        unused[(record["address"], record.get("dest_tag"))] = record
+        except FileNotFoundError:
+            pass
+
+        self._compact(list(unused.values()))
+
+        loaded: Dict[str, List[dict]] = {}
+        for record in unused.values():
+            currency = record.pop("currency")
+            loaded.setdefault(currency, []).append(record)
+        return loaded
+
+    def _compact(self, records: List[dict]) -> None:
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.writelines(json.dumps(record) + "\n" for record in records)
+        os.replace(tmp, self.path)
+
+    ### LIFECYCLE
+
+    async def start(self) -> None:
+        """
+        load the persisted addresses and start refilling in the background
+        """
+
+        if self._task is not None:
+            return
+
+        if self.path is not None:
+            loaded = await self._run_in_executor(self._load)
+            for currency, addresses in loaded.items():
+                self._reserves.setdefault(currency, deque()).extend(addresses)
+
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        if self.path is not None:
+            records = [
+                {"currency": currency, **address}
+                for currency, reserve in self._reserves.items()
+                for address in reserve
+            ]
+            await self._run_in_executor(self._compact, records)
+
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> "AddressPool":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "reserves": {c: len(r) for c, r in self._reserves.items()},
+            "targets": {c: self.target(c) for c in self.currencies},
+        }
@@ -0,0 +1,278 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Tuple
+
+from .commands import (
+    COMMAND_GROUPS,
+    COMMAND_PRIORITIES,
+    DEFAULT_GROUP,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+)
+from .errors import CircuitOpenError
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _Circuit:
+    __slots__ = (
+        "group",
+        "state",
+        "outcomes",
+        "failures",
+        "slow",
+        "opened_at",
+        "trials",
+        "successes",
+        "in_flight",
+        "rejected",
+    )
+
+    def __init__(self, group: str, window: int) -> None:
+        self.group = group
+        self.state = CLOSED
+        # (failed, slow) of the last calls
+        self.outcomes: Deque[Tuple[int, int]] = deque(maxlen=window)
+        self.failures = 0
+        self.slow = 0
+        self.opened_at = 0.0
+        self.trials = 0  # half open trial calls in flight
+        self.successes = 0  # successful trial calls since the last opening
+        self.in_flight = 0
+        self.rejected = 0
+
+    def failure_rate(self) -> float:
+        return self.failures / len(self.outcomes) if self.outcomes else 0.0
+
+    def slow_rate(self) -> float:
+        return self.slow / len(self.outcomes) if self.outcomes else 0.0
+
+    def add(self, failed: bool, slow: bool) -> None:
+        outcomes = self.outcomes
+        if len(outcomes) == outcomes.maxlen:
+            old_failed, old_slow = outcomes[0]
+            self.failures -= old_failed
+            self.slow -= old_slow
+        outcomes.append((int(failed), int(slow)))
+        self.failures += failed
+        self.slow += slow
+
+    def reset(self, state: str) -> None:
+        self.state = state
+        self.outcomes.clear()
+        self.failures = 0
+        self.slow = 0
+        self.trials = 0
+        self.successes = 0
+
+
+class CircuitBreaker:
+    """
+    Fails api calls fast while a group of commands is unhealthy
+
+    The failures and the slow calls of each command group are tracked over a sliding
+    window of calls. When either rate crosses its threshold the circuit of the group
+    opens and its calls raise CircuitOpenError without touching the network, after
+    ``open_duration`` a few trial calls are let through: if they all succeed the
+    circuit closes, otherwise it opens again. While a group is degraded, or is
+    probing, its low priority calls (bulk polling, history walks) are shed first
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        slow_threshold: float = 0.8,
+        slow_call_duration: float = 5.0,
+        shed_threshold: float = 0.25,
+        window: int = 50,
+        min_calls: int = 10,
+        open_duration: float = 30.0,
+        half_open_calls: int = 3,
+        shed_in_flight: int = None,
+        groups: Dict[str, str] = None,
+        priorities: Dict[str, int] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        failure_threshold : float, optional
+            the rate of failed calls that opens the circuit, by default 0.5
+        slow_threshold : float, optional
+            the rate of slow calls that opens the circuit, by default 0.8
+        slow_call_duration : float, optional
+            calls taking longer than this many seconds, including the wait in the
+            scheduler, are slow, by default 5.0
+        shed_threshold : float, optional
+            the rate of failed or slow calls above which low priority calls are shed, by default 0.25
+        window : int, optional
+            the number of recent calls of a group the rates are computed on, by default 50
+        min_calls : int, optional
+            the circuit can't open before this many calls are in the window, by default 10
+        open_duration : float, optional
+            how many seconds the circuit stays open before probing, by default 30.0
+        half_open_calls : int, optional
+            the number of successful trial calls that close the circuit, by default 3
+        shed_in_flight : int, optional
+            if set, low priority calls are shed while this many calls of their group are in flight, by default None
+        groups : Dict[str, str], optional
+            the group of each cmd, merged over the defaults, by default None
+        priorities : Dict[str, int], optional
+            the priority lane of each cmd, merged over the defaults, by default None
+        """
+
+        self.failure_threshold = failure_threshold
+        self.slow_threshold = slow_threshold
+        self.slow_call_duration = slow_call_duration
+        self.shed_threshold = shed_threshold
+        self.window = window
+        self.min_calls = min_calls
+        self.open_duration = open_duration
+        self.half_open_calls = half_open_calls
+        self.shed_in_flight = shed_in_flight
+
+        self.groups = dict(COMMAND_GROUPS)
+        if groups:
+            self.groups.update(groups)
+        self.priorities = dict(COMMAND_PRIORITIES)
+        if priorities:
+            self.priorities.update(priorities)
+
+        self._circuits: Dict[str, _Circuit] = {}
+
+    def circuit(self, cmd: str) -> _Circuit:
+        group = self.groups.get(cmd, DEFAULT_GROUP)
+        circuit = self._circuits.get(group)
+        if circuit is None:
+            circuit = self._circuits[group] = _Circuit(group, self.window)
+        return circuit
+
+    def _retry_after(self, circuit: _Circuit, now: float) -> float:
+        if circuit.state != OPEN:
+            return 0.0
+        return max(0.0, circuit.opened_at + self.open_duration - now)
+
+    def _reject(self, circuit: _Circuit, now: float, shed: bool = False):
+        circuit.rejected += 1
+        raise CircuitOpenError(circuit.group, self._retry_after(circuit, now), shed)
+
+    def _degraded(self, circuit: _Circuit) -> bool:
+        if self.shed_in_flight is not None and circuit.in_flight >= self.shed_in_flight:
+            return True
+        if len(circuit.outcomes) < self.min_calls:
+            return False
+        return (
+            circuit.failure_rate() >= self.shed_threshold
+            or circuit.slow_rate() >= self.shed_threshold
+        )
+
+    def acquire(self, cmd: str, priority: int = None) -> Tuple[_Circuit, bool]:
+        """
+        let cmd through or raise CircuitOpenError, returns the circuit of cmd and
+        whether the call is a trial call. Every acquire must be paired with a
+        record or a release. The call is in the lane of cmd unless a priority is
+        passed
+        """
+
+        circuit = self.circuit(cmd)
+        now = time.monotonic()
+
+        if circuit.state == OPEN:
+            if now - circuit.opened_at < self.open_duration:
+                self._reject(circuit, now)
+            circuit.reset(HALF_OPEN)
+
+        if priority is None:
+            priority = self.priorities.get(cmd, PRIORITY_NORMAL)
+        low = priority >= PRIORITY_LOW
+        trial = circuit.state == HALF_OPEN
+
+        if trial:
+            # probe with the calls that matter, bulk traffic waits for the close
+            if low or circuit.trials >= self.half_open_calls:
+                self._reject(circuit, now, shed=low)
+            circuit.trials += 1
+        elif low and self._degraded(circuit):
+            self._reject(circuit, now, shed=True)
+
+        circuit.in_flight += 1
+        return circuit, trial
+
+    def release(self, circuit: _Circuit, trial: bool) -> None:
+        """
+        end a call that has no outcome, like a cancelled one
+        """
+
+        circuit.in_flight -= 1
+        if trial and circuit.state == HALF_OPEN:
+            circuit.trials = max(0, circuit.trials - 1)
+
+    def record(
+        self,
+        circuit: _Circuit,
+        trial: bool,
+        failed: bool,
+        duration: float,
+        timed_out: bool = False,
+    ) -> None:
+        """
+        end a call with its outcome, a call cut short by its deadline is failed and
+        slow whatever its duration
+        """
+
+        circuit.in_flight -= 1
+        slow = timed_out or duration >= self.slow_call_duration
+
+        if trial:
+            if circuit.state != HALF_OPEN:  # reopened by another trial
+                return
+            circuit.trials = max(0, circuit.trials - 1)
+            if failed or slow:
+                self._open(circuit)
+                return
+            circuit.successes += 1
+            if circuit.successes >= self.half_open_calls:
+                circuit.reset(CLOSED)
+            return
+
+        if circuit.state != CLOSED:  # started before the circuit opened
+            return
+
+        circuit.add(failed, slow)
+        if len(circuit.outcomes) >= self.min_calls and (
+            circuit.failure_rate() >= self.failure_threshold
+            or circuit.slow_rate() >= self.slow_threshold
+        ):
+            self._open(circuit)
+
+    def _open(self, circuit: _Circuit) -> None:
+        circuit.reset(OPEN)
+        circuit.opened_at = time.monotonic()
+
+    def health(self) -> Dict[str, dict]:
+        """
+        the state of the circuit of every group seen so far, for health checks
+        """
+
+        now = time.monotonic()
+        return {
+            group: {
+                "state": circuit.state,
+                "failure_rate": circuit.failure_rate(),
+                "slow_rate": circuit.slow_rate(),
+                "calls": len(circuit.outcomes),
+                "in_flight": circuit.in_flight,
+                "rejected": circuit.rejected,
+                "retry_after": self._retry_after(circuit, now),
+            }
+            for group, circuit in self._circuits.items()
+        }
+
+    @property
+    def healthy(self) -> bool:
+        """
+        True if no circuit is open
+        """
+
+        return all(c.state != OPEN for c in self._circuits.values())
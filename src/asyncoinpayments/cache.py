@@ -0,0 +1,151 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+from .commands import CACHE_TTLS, WRITE_INVALIDATIONS
+
+MISSING = object()
+
+
+class ResponseCache:
+    """
+    Bounded LRU cache with per command time to live for read only api responses
+
+    The cached payloads are shared between hits, they should be treated as read only
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float] = None,
+        maxsize: int = 1024,
+        invalidations: Dict[str, tuple] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        ttls : Dict[str, float], optional
+            time to live in seconds for each cmd, merged over the defaults, a ttl of 0 disables caching for that cmd, by default None
+        maxsize : int, optional
+            the maximum number of cached responses, the least recently used are evicted first, by default 1024
+        invalidations : Dict[str, tuple], optional
+            write commands mapped to the cached commands they invalidate, merged over the defaults, by default None
+        """
+
+        self.ttls = dict(CACHE_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+        self.invalidations = dict(WRITE_INVALIDATIONS)
+        if invalidations:
+            self.invalidations.update(invalidations)
+
+        self.maxsize = maxsize
+        # key -> (expires_at, cmd, payload)
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self._cmd_stats: Dict[str, list] = {}
+        # bumped every time the responses of a cmd are invalidated
+        self._generations: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ttl(self, cmd: str) -> Optional[float]:
+        """
+        returns the time to live of cmd, None if cmd is not cacheable
+        """
+
+        ttl = self.ttls.get(cmd)
+        return ttl if ttl else None
+
+    def _count(self, cmd: str, hit: bool) -> None:
+        stats = self._cmd_stats.setdefault(cmd, [0, 0])
+        if hit:
+            self.hits += 1
+            stats[0] += 1
+        else:
+            self.misses += 1
+            stats[1] += 1
+
+    def get(self, key: Hashable, cmd: str) -> Any:
+        """
+        returns the cached payload stored under key or MISSING if absent or expired
+        """
+
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self._count(cmd, hit=False)
+            return MISSING
+
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self._count(cmd, hit=False)
+            return MISSING
+
+        self._entries.move_to_end(key)
+        self._count(cmd, hit=True)
+        return entry[2]
+
+    def set(self, key: Hashable, cmd: str, payload: Any) -> None:
+        ttl = self.ttl(cmd)
+        if ttl is None:
+            return
+
+        self._entries[key] = (time.monotonic() + ttl, cmd, payload)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def generation(self, cmd: str) -> int:
+        """
+        the number of times the responses of cmd were invalidated, a response read
+        while it changed may predate a write and must not be cached
+        """
+
+        return self._generations.get(cmd, 0)
+
+    def invalidate(self, *cmds: str) -> None:
+        """
+        drop every cached response of the given commands
+        """
+
+        for cmd in cmds:
+            self._generations[cmd] = self._generations.get(cmd, 0) + 1
+
+        stale = [key for key, entry in self._entries.items() if entry[1] in cmds]
+        for key in stale:
+            del self._entries[key]
+
+    def after_write(self, cmd: str) -> None:
+        """
+        drop the cached responses made stale by the write command cmd
+        """
+
+        invalidated = self.invalidations.get(cmd)
+        if invalidated:
+            self.invalidate(*invalidated)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            the global and per cmd hit/miss counters and the current cache size
+        """
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "commands": {
+                cmd: {"hits": hits, "misses": misses}
+                for cmd, (hits, misses) in self._cmd_stats.items()
+            },
+        }
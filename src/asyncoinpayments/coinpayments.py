@@ -1,15 +1,90 @@
-import hashlib
-import hmac
-import urllib.error
-import urllib.parse
-import urllib.request
-from typing import Union
+import asyncio
+import logging
+import time
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import aiohttp
-from tenacity import retry, stop_after_attempt
 
-from .errors import CoinPayementsError, CoinPaymentsInputError, FormatError
-from .utils import ApiResponseJson, JsonResponse, ResponseFormat
+from . import utils
+from .breaker import CircuitBreaker
+from .cache import MISSING, ResponseCache
+from .commands import READ_ONLY_COMMANDS
+from .errors import CoinPayementsError, CoinPaymentsInputError
+from .hedging import HedgePolicy
+from .metrics import CANCELLED, RequestEvent, RequestObserver, trace_config
+from .models import (
+    Rate,
+    TxInfo,
+    WithdrawalInfo,
+    parse_balances,
+    parse_rates,
+)
+from .rates import RatesSnapshot
+from .retry import RetryPolicy
+from .scheduler import RequestScheduler, is_rate_limited
+from .signing import RequestSigner, encode_params
+from .utils import (
+    ApiResponseJson,
+    JsonResponse,
+    LazyJsonResponse,
+    ResponseFormat,
+    chunked,
+)
+from .warmstart import WarmStart
+from .xmlstream import parse_xml_stream
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# the maximum number of payment ids accepted by a single get_tx_info_multi call
+TX_INFO_MULTI_MAX = 25
+# the number of withdrawals sent per create_mass_withdrawal call, larger batches are split
+MASS_WITHDRAWAL_MAX = 100
+# the size of the body chunks fed to the xml parser
+XML_CHUNK_SIZE = 64 * 1024
+
+
+def create_session(
+    connection_limit: int = 100,
+    connection_limit_per_host: int = 0,
+    keepalive_timeout: float = 30.0,
+    dns_cache_ttl: int = 300,
+    traced: bool = False,
+) -> aiohttp.ClientSession:
+    """
+    build a session over a keep-alive connection pool, it must be called with a
+    running event loop
+
+    Parameters
+    ----------
+    traced : bool, optional
+        if set to True the connection phases of the requests are traced for the observers, by default False
+    """
+
+    connector = aiohttp.TCPConnector(
+        limit=connection_limit,
+        limit_per_host=connection_limit_per_host,
+        keepalive_timeout=keepalive_timeout,
+        ttl_dns_cache=dns_cache_ttl,
+    )
+    # the connection phases are traced only when someone is listening
+    trace_configs = [trace_config()] if traced else None
+
+    return aiohttp.ClientSession(connector=connector, trace_configs=trace_configs)
 
 
 class AsynCoinPayments:
@@ -23,7 +98,71 @@ class AsynCoinPayments:
         _format: ResponseFormat = ResponseFormat.JSON,
         _proxy: str = None,
         _proxy_auth: str = None,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        cache: ResponseCache = None,
+        scheduler: RequestScheduler = None,
+        retry_policy: RetryPolicy = None,
+        json_loads: Callable[[bytes], Any] = None,
+        lazy_json: bool = False,
+        observers: Iterable[RequestObserver] = None,
+        session: aiohttp.ClientSession = None,
+        coalesce: bool = True,
+        timeout: float = None,
+        hedge: HedgePolicy = None,
+        breaker: CircuitBreaker = None,
+        warm_start: WarmStart = None,
     ) -> None:
+        """
+        Parameters
+        ----------
+        private_key : str
+            the private key of the CoinPayments api key pair
+        public_key : str
+            the public key of the CoinPayments api key pair
+        version : str, optional
+            the api version, by default "1"
+        connection_limit : int, optional
+            the maximum number of simultaneous connections kept by the pool, by default 100
+        connection_limit_per_host : int, optional
+            the maximum number of simultaneous connections to the same host, 0 means no limit, by default 0
+        keepalive_timeout : float, optional
+            how many seconds an idle connection is kept alive for reuse, by default 30.0
+        dns_cache_ttl : int, optional
+            how many seconds resolved addresses are cached, by default 300
+        cache : ResponseCache, optional
+            if passed, the responses of read only commands are cached in it, by default None
+        scheduler : RequestScheduler, optional
+            if passed, every api call waits for its turn in it, by default None
+        retry_policy : RetryPolicy, optional
+            decides which failed requests are retried, by default a RetryPolicy of REQUEST_TRIES attempts
+        json_loads : Callable[[bytes], Any], optional
+            the function decoding the raw json responses, by default orjson or msgspec if installed, else the json module
+        lazy_json : bool, optional
+            if set to True the responses are LazyJsonResponse, decoded only when their result is accessed, by default False
+        observers : Iterable[RequestObserver], optional
+            notified of the timings of every request, they must be set before the first request, by default None
+        session : aiohttp.ClientSession, optional
+            a session shared with other clients, it is not closed by this client and its
+            own connector settings are used, by default None
+        coalesce : bool, optional
+            if set to True identical read only calls made while one is in flight share
+            its response, which must then be treated as read only, by default True
+        timeout : float, optional
+            the default deadline in seconds of a whole api call, from the wait in the
+            scheduler to the last byte of the response and across retries, by default None
+        hedge : HedgePolicy, optional
+            if passed, slow idempotent reads are sent a second time and the first
+            response is used, by default None
+        breaker : CircuitBreaker, optional
+            if passed, the calls to unhealthy command groups fail fast with
+            CircuitOpenError and low priority calls are shed first, by default None
+        warm_start : WarmStart, optional
+            if passed, the responses it loaded from disk are served marked stale until
+            their live responses, fetched in the background, replace them, by default None
+        """
         self._private_key = private_key
         self._public_key = public_key
         self._version = version
@@ -34,57 +173,259 @@ class AsynCoinPayments:
         self.base_url = "https://www.coinpayments.net/api.php"
         self._format = _format  # the format of the http response can be json/xml
 
+        # connection pool settings, the session itself is created lazily because
+        # aiohttp needs a running event loop to build it
+        self._connection_limit = connection_limit
+        self._connection_limit_per_host = connection_limit_per_host
+        self._keepalive_timeout = keepalive_timeout
+        self._dns_cache_ttl = dns_cache_ttl
+        self._session: aiohttp.ClientSession = session
+        self._owns_session = session is None
+
+        self.cache = cache
+        self.scheduler = scheduler
+        self.retry_policy = retry_policy or RetryPolicy(max_attempts=self.REQUEST_TRIES)
+
+        self._signer = RequestSigner(private_key, public_key, version, _format)
+
+        self._json_loads = json_loads or utils.json_loads
+        self._lazy_json = lazy_json
+
+        self.observers: List[RequestObserver] = list(observers or ())
+
+        self.coalesce = coalesce
+        self._in_flight: Dict[Tuple[bytes, int], asyncio.Future] = {}
+
+        self.timeout = timeout
+        self.hedge = hedge
+        self.breaker = breaker
+
+        self.warm_start = warm_start
+        self._warm_refreshes: Dict[str, asyncio.Task] = {}
+
+    async def __aenter__(self) -> "AsynCoinPayments":
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        returns the long lived session, creating it on first use
+        """
+
+        if self._owns_session and (self._session is None or self._session.closed):
+            self._session = create_session(
+                connection_limit=self._connection_limit,
+                connection_limit_per_host=self._connection_limit_per_host,
+                keepalive_timeout=self._keepalive_timeout,
+                dns_cache_ttl=self._dns_cache_ttl,
+                traced=bool(self.observers),
+            )
+
+        return self._session
+
+    async def close(self) -> None:
+        """
+        close the underlying session and all its pooled connections
+        """
+
+        try:
+            refreshes = list(self._warm_refreshes.values())
+            for task in refreshes:
+                task.cancel()
+            await asyncio.gather(*refreshes, return_exceptions=True)
+
+            if self.warm_start is not None:
+                await self.warm_start.flush()
+        finally:
+            # a failed snapshot write must not leak the connections
+            if self._owns_session:
+                if self._session is not None and not self._session.closed:
+                    await self._session.close()
+                self._session = None
+
+    async def warmup(self, connections: int = 1) -> None:
+        """
+        pre-open connections to the CoinPayments api so that the first api calls
+        do not pay the dns, tcp and tls setup cost
+
+        Parameters
+        ----------
+        connections : int, optional
+            how many connections to open concurrently, by default 1
+        """
+
+        session = self._get_session()
+
+        async def _open() -> None:
+            async with session.head(
+                url=self.base_url,
+                proxy=self.proxy,
+                proxy_auth=self._proxy_auth,
+            ) as r:
+                await r.read()
+
+        # the connections are released back to the pool once the responses are read
+        await asyncio.gather(*(_open() for _ in range(connections)))
+
     def create_hmac(self, **params):
         """
         create hmac for api requests
         """
 
-        encoded = urllib.parse.urlencode(params).encode("utf-8")
-        # print(encoded) #to fix tx and multiple calls at once
-        h = hmac.new(
-            bytearray(self._private_key, "utf-8"), encoded, hashlib.sha512
-        ).hexdigest()
+        encoded = encode_params(params).encode("utf-8")
+        h = self._signer.sign(encoded)
 
         return encoded, h
 
-    @retry(
-        stop=stop_after_attempt(3)
-    )  # TODO ADD WAIT TIME MAYBE? -> hard with async and tenacity
     async def request(self, method, **params):
         """
-        request handler
+        request handler, failed requests are retried according to the retry policy
         """
 
-        encoded, h = self.create_hmac(**params)
-        headers = {"hmac": h}
+        encoded = encode_params(params).encode("utf-8")
+        call = self._request(method, params.get("cmd"), encoded)
 
-        async with aiohttp.ClientSession() as session:
-            # TODO
-            # ERROR HANDLING
-            if method == "get":
-                r = await session.get(
-                    url=self.base_url,
-                    headers=headers,
-                    proxy=self.proxy,
-                    proxy_auth=self._proxy_auth,
-                )
-            elif method == "post":
-                headers["Content-Type"] = "application/x-www-form-urlencoded"
-                r = await session.post(
-                    url=self.base_url,
-                    headers=headers,
-                    data=encoded,
-                    proxy=self.proxy,
-                    proxy_auth=self._proxy_auth,
-                )
+        if self.timeout is None:
+            return await call
+        return await asyncio.wait_for(call, self.timeout)
+
+    async def _request(
+        self,
+        method: str,
+        cmd: str,
+        encoded: bytes,
+        scheduled: bool = False,
+        priority: int = None,
+    ):
+        async for attempt in self.retry_policy.retrying(cmd):
+            with attempt:
+                if scheduled:
+                    return await self._scheduled_attempt(method, cmd, encoded, priority)
+                return await self._attempt(method, cmd, encoded)
+
+    async def _attempt(self, method: str, cmd: str, encoded: bytes):
+        if self.observers:
+            return await self._observed_request(method, cmd, encoded)
+        return await self._request_once(method, encoded)
+
+    async def _scheduled_attempt(
+        self, method: str, cmd: str, encoded: bytes, priority: int = None
+    ):
+        """
+        send a single attempt once the scheduler grants it a slot and a token, the
+        backoff between attempts holds neither
+        """
+
+        scheduler = self.scheduler
+
+        async with scheduler.slot(cmd, priority):
+            try:
+                data = await self._attempt(method, cmd, encoded)
+            except aiohttp.ClientResponseError as e:
+                if e.status == 429:
+                    scheduler.penalize()
+                raise
+
+        error = self._error_of(data)
+        if error is not None and is_rate_limited(error):
+            scheduler.penalize()
+        else:
+            scheduler.record_success()
+
+        return data
+
+    async def _observed_request(self, method: str, cmd: str, encoded: bytes):
+        """
+        send the request recording its phases and notify the observers
+        """
+
+        start = time.time()
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        error = None
+
+        try:
+            data = await self._request_once(method, encoded, timings)
+            error = self._error_of(data)
+            if error == "ok":
+                error = None
+            return data
+        except asyncio.CancelledError:
+            error = CANCELLED
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            timings["total"] = time.perf_counter() - started
+            # drop the trace marks of phases that never ended
+            phases = {k: v for k, v in timings.items() if not k.startswith("_")}
+            event = RequestEvent(cmd, start, phases, error)
+            for observer in self.observers:
+                observer.on_request(event)
+
+    async def _request_once(
+        self, method: str, encoded: bytes, timings: Dict[str, float] = None
+    ):
+        mark = time.perf_counter() if timings is not None else 0.0
+        headers = {"hmac": self._signer.sign(encoded)}
+        if timings is not None:
+            timings["sign"] = time.perf_counter() - mark
+
+        session = self._get_session()
+
+        if method == "get":
+            request_ctx = session.get(
+                url=self.base_url,
+                headers=headers,
+                proxy=self.proxy,
+                proxy_auth=self._proxy_auth,
+                trace_request_ctx=timings,
+            )
+        elif method == "post":
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+            request_ctx = session.post(
+                url=self.base_url,
+                headers=headers,
+                data=encoded,
+                proxy=self.proxy,
+                proxy_auth=self._proxy_auth,
+                trace_request_ctx=timings,
+            )
+
+        # the response is released back to the connection pool on exit
+        async with request_ctx as r:
             # ERRORS
             if r.status != 200:
                 r.raise_for_status()
             # FORMATS
-            if self._format == "json":
-                response_formatted = await r.json()
-            elif self._format == "xml":
-                response_formatted = await r.text()
+            mark = time.perf_counter() if timings is not None else 0.0
+
+            if self._format == "xml":
+                # parsed while it arrives, so read and decode are one phase
+                response_formatted = await parse_xml_stream(
+                    r.content.iter_chunked(XML_CHUNK_SIZE)
+                )
+                if timings is not None:
+                    timings["read"] = time.perf_counter() - mark
+                return response_formatted
+
+            raw = await r.read()
+            if timings is not None:
+                timings["read"] = time.perf_counter() - mark
+
+        mark = time.perf_counter() if timings is not None else 0.0
+
+        if self._lazy_json:
+            response_formatted = LazyJsonResponse(raw, self._json_loads)
+        else:
+            response_formatted = self._json_loads(raw)
+
+        if timings is not None:
+            timings["decode"] = time.perf_counter() - mark
 
         return response_formatted
 
@@ -98,33 +439,287 @@ class AsynCoinPayments:
 
         return await self.request(method="post", **params)
 
-    async def api_call(self, cmd: str, **params) -> Union[JsonResponse, str]:
+    async def api_call(
+        self, cmd: str, *, timeout: float = None, priority: int = None, **params
+    ) -> JsonResponse:
+        """
+        perform an api call given a cmd and its parameters, json and xml responses
+        are both returned as a JsonResponse
+
+        Parameters
+        ----------
+        timeout : float, optional
+            the deadline in seconds of this call, asyncio.TimeoutError is raised
+            when it passes, by default the client timeout
+        priority : int, optional
+            the scheduler and circuit breaker lane of this call, such as
+            commands.PRIORITY_LOW for background work, by default the one of cmd
+        """
+
+        encoded = self._signer.encode(cmd, params)
+        cache = self.cache
+        cache_key = None
+
+        if cache is not None and cache.ttl(cmd) is not None:
+            cache_key = (cmd, encoded)
+            data = cache.get(cache_key, cmd)
+            if data is not MISSING:
+                return self._wrap_response(data)
+
+        warm = self.warm_start
+        warm_key = None
+        if warm is not None and cmd in warm.commands:
+            warm_key = warm.key(cmd, params, self._public_key)
+            stale = warm.stale(warm_key)
+            if stale is not None:
+                self._refresh_warm(cmd, encoded, cache_key, warm_key)
+                response = JsonResponse(stale[0])
+                response.stale = True
+                return response
+
+        if timeout is None:
+            timeout = self.timeout
+
+        # the deadline covers the scheduler wait, every attempt and the body read, it
+        # is passed down so that the circuit breaker sees the calls it cuts short
+        deadline = self._deadline(timeout)
+        data = await self._fetch(cmd, encoded, cache_key, deadline, priority)
+
+        if warm_key is not None and self._is_ok(data):
+            warm.put(warm_key, self._plain(data))
+
+        return self._wrap_response(data)
+
+    def _refresh_warm(self, cmd: str, encoded: bytes, cache_key, warm_key: str) -> None:
         """
-        perform an api call given a cmd and its parameters
+        fetch in the background the live response of a call served stale, once
         """
 
-        base_params = {
-            "cmd": cmd,
-            "key": self._public_key,
-            "version": self._version,
-            "format": self._format,
-        }
-        if self._format == "json":
-            data: ApiResponseJson = await self.post(**base_params, **params)
-            response: JsonResponse = JsonResponse(data=data)
+        if warm_key in self._warm_refreshes:
+            return
+
+        async def _refresh() -> None:
+            try:
+                deadline = self._deadline(self.timeout)
+                data = await self._fetch(cmd, encoded, cache_key, deadline)
+                if self._is_ok(data):
+                    self.warm_start.put(warm_key, self._plain(data))
+            except (CoinPayementsError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("refreshing the stale %s response failed: %s", cmd, e)
+            finally:
+                self._warm_refreshes.pop(warm_key, None)
+
+        self._warm_refreshes[warm_key] = asyncio.ensure_future(_refresh())
+
+    @staticmethod
+    def _plain(data: Union[ApiResponseJson, JsonResponse]) -> ApiResponseJson:
+        if isinstance(data, JsonResponse):
+            return {"error": data.error, "result": data.result}
+        return data
+
+    @staticmethod
+    def _deadline(timeout: Optional[float]) -> Optional[float]:
+        if timeout is None:
+            return None
+        return asyncio.get_running_loop().time() + timeout
+
+    @staticmethod
+    async def _within(call: Awaitable[T], deadline: Optional[float]) -> T:
+        """
+        await call, raise asyncio.TimeoutError if it isn't done by the loop time deadline
+        """
+
+        if deadline is None:
+            return await call
+        return await asyncio.wait_for(
+            call, deadline - asyncio.get_running_loop().time()
+        )
+
+    async def _fetch(
+        self,
+        cmd: str,
+        encoded: bytes,
+        cache_key,
+        deadline: float = None,
+        priority: int = None,
+    ) -> JsonResponse:
+        cache = self.cache
+        if cache is None:
+            return await self._coalesced_send(cmd, encoded, deadline, priority)
+
+        generation = cache.generation(cmd)
+        try:
+            data = await self._coalesced_send(cmd, encoded, deadline, priority)
+        finally:
+            # a failed write may still have reached the api
+            cache.after_write(cmd)
+
+        # a write finished while this read was in flight, its response may predate it
+        if (
+            cache_key is not None
+            and cache.generation(cmd) == generation
+            and self._is_ok(data)
+        ):
+            cache.set(cache_key, cmd, data)
+
+        return data
+
+    async def _coalesced_send(
+        self, cmd: str, encoded: bytes, deadline: float = None, priority: int = None
+    ) -> JsonResponse:
+        """
+        send the api call, identical read only calls already in flight share its
+        round trip and its result instead of sending their own. The shared request
+        runs until the deadline and in the lane of the call that sent it, each caller
+        only waits for it until its own deadline
+        """
+
+        if not self.coalesce or cmd not in READ_ONLY_COMMANDS:
+            return await self._hedged_send(cmd, encoded, deadline, priority)
+
+        # calls made after a write that invalidated cmd don't join the reads sent
+        # before it, writes are tracked by the cache
+        cache = self.cache
+        key = (encoded, cache.generation(cmd) if cache is not None else 0)
+        task = self._in_flight.get(key)
+
+        if task is None:
+            # the request runs in its own task so that a cancelled caller does not
+            # cancel it for the others waiting on it
+            task = asyncio.ensure_future(
+                self._hedged_send(cmd, encoded, deadline, priority)
+            )
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._shared_done(key, t))
+
+        return await self._within(asyncio.shield(task), deadline)
+
+    def _shared_done(self, key, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        # every caller may have given up already, the failure is then only retrieved
+        # here so that asyncio doesn't report it as never retrieved
+        if not task.cancelled():
+            task.exception()
+
+    async def _hedged_send(
+        self, cmd: str, encoded: bytes, deadline: float = None, priority: int = None
+    ) -> JsonResponse:
+        """
+        send the api call, a second time if it is a slow idempotent read and
+        hedging is enabled
+        """
+
+        hedge = self.hedge
+        if hedge is None or not hedge.applies(cmd):
+            data = await self._send(cmd, encoded, deadline, priority)
         else:
-            response: str = await self.post(**base_params, **params)
+            data = await hedge.run(
+                cmd, lambda: self._send(cmd, encoded, deadline, priority)
+            )
 
-        return response
+        # wrapped once, the callers sharing the response through the cache or a
+        # coalesced call also share its typed result
+        return self._wrap_response(data)
+
+    async def _send(
+        self, cmd: str, encoded: bytes, deadline: float = None, priority: int = None
+    ) -> ApiResponseJson:
+        """
+        post the api call unless the circuit breaker rejects it, its outcome is
+        recorded by the breaker
+        """
+
+        breaker = self.breaker
+        if breaker is None:
+            return await self._within(
+                self._scheduled_send(cmd, encoded, priority), deadline
+            )
+
+        # checked before the scheduler queue so that rejected calls fail fast
+        circuit, trial = breaker.acquire(cmd, priority)
+        start = time.perf_counter()
+
+        try:
+            data = await self._within(
+                self._scheduled_send(cmd, encoded, priority), deadline
+            )
+        except asyncio.CancelledError:
+            # a hedge that lost or a caller that gave up, the call has no outcome
+            breaker.release(circuit, trial)
+            raise
+        except asyncio.TimeoutError:
+            duration = time.perf_counter() - start
+            breaker.record(circuit, trial, True, duration, timed_out=True)
+            raise
+        except Exception as e:
+            failed = self.retry_policy.is_transient(e)
+            breaker.record(circuit, trial, failed, time.perf_counter() - start)
+            raise
+
+        breaker.record(circuit, trial, False, time.perf_counter() - start)
+        return data
+
+    async def _scheduled_send(
+        self, cmd: str, encoded: bytes, priority: int = None
+    ) -> ApiResponseJson:
+        """
+        post the api call, every attempt waits for its turn in the scheduler if
+        there is one
+        """
+
+        return await self._request(
+            "post", cmd, encoded, self.scheduler is not None, priority
+        )
+
+    def _wrap_response(
+        self, data: Union[ApiResponseJson, JsonResponse]
+    ) -> JsonResponse:
+        if isinstance(data, JsonResponse):
+            return data
+
+        # json and xml responses are both decoded to the same structure
+        return JsonResponse(data=data)
+
+    def _error_of(self, data: Union[ApiResponseJson, JsonResponse]) -> str:
+        if isinstance(data, JsonResponse):
+            return data.error
+        return data["error"]
+
+    def _is_ok(self, data: Union[ApiResponseJson, JsonResponse]) -> bool:
+        return self._error_of(data) == "ok"
+
+    def _typed(
+        self, response: JsonResponse, kind: str, parse: Callable[[Any], Any]
+    ) -> JsonResponse:
+        """
+        a copy of response whose result is parsed into typed models, the response
+        itself may be shared with the cache so only the copy is kept on it, under
+        kind, and reused by the next typed calls sharing the response
+        """
+
+        if response.error != "ok":
+            return response
+
+        parsed = response._parsed
+        if parsed is None:
+            parsed = response._parsed = {}
+
+        typed = parsed.get(kind)
+        if typed is None:
+            typed = parsed[kind] = JsonResponse(
+                {"error": response.error, "result": parse(response.result)}
+            )
+            typed.stale = response.stale
+        return typed
 
     ### INFORMATION COMMANDS
-    async def get_basic_info(self) -> Union[JsonResponse, str]:
+    async def get_basic_info(self) -> JsonResponse:
         """
         retrieves basic user info from the CoinPayments api
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the basic user info
         """
 
@@ -137,13 +732,19 @@ class AsynCoinPayments:
         short: bool = True,
         specify_accepted: bool = True,
         only_accepted: bool = True,
-    ) -> Union[JsonResponse, str]:
+        typed: bool = False,
+    ) -> JsonResponse:
         """
         retrieves rates informations from the CoinPayments api
 
+        Parameters
+        ----------
+        typed : bool, optional
+            if set to True the result maps every currency to a Rate, by default False
+
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the currency rates informations
         """
 
@@ -158,7 +759,9 @@ class AsynCoinPayments:
 
         params = {"short": 1 if short else 0, "accepted": accepted_option}
 
-        return await self.api_call(cmd, **params)
+        response = await self.api_call(cmd, **params)
+
+        return self._typed(response, "rates", parse_rates) if typed else response
 
     ### RECEIVING PAYMENTS
     async def create_transaction(
@@ -169,13 +772,13 @@ class AsynCoinPayments:
         base_currency: str = "USD",
         ipn_url: str = None,
         **params,
-    ) -> Union[JsonResponse, str]:
+    ) -> JsonResponse:
         """
         creates a cryptocurrency transaction to receive client funds
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the transaction informations
         """
 
@@ -194,14 +797,19 @@ class AsynCoinPayments:
         return await self.api_call(cmd, **necessary_params, **params)
 
     async def get_callback_address(
-        self, currency, ipn_url: str = None, **params
-    ) -> Union[JsonResponse, str]:
+        self, currency, ipn_url: str = None, priority: int = None, **params
+    ) -> JsonResponse:
         """
         retrieves basic user info from the CoinPayments api
 
+        Parameters
+        ----------
+        priority : int, optional
+            the lane of the call, by default the high priority one of checkouts
+
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the callback address
         """
 
@@ -209,23 +817,105 @@ class AsynCoinPayments:
 
         cmd = "get_callback_address"
 
-        return await self.api_call(cmd, **necessary_params, **params)
+        return await self.api_call(cmd, priority=priority, **necessary_params, **params)
 
-    async def get_tx_info_multi(self, txid):
-        ...
+    async def get_tx_info_multi(
+        self, txids: Iterable[str], concurrency: int = 4
+    ) -> JsonResponse:
+        """
+        retrieves the informations of many transactions from the CoinPayments api,
+        the txids are split in chunks of up to 25 payment ids which are queried concurrently
 
-    # TODO FIX THIS 	Lets you query up to 25 payment ID(s) (API key must belong to the seller.)
-    # Payment IDs should be separated with a | (pipe symbol.)
+        Parameters
+        ----------
+        txids : Iterable[str]
+            the payment ids to query, the api key must belong to the seller
+        concurrency : int, optional
+            the maximum number of chunks queried at the same time, by default 4
+
+        Returns
+        -------
+        JsonResponse
+            api response whose result maps every txid to its informations, if the chunk
+            of a txid failed its entry only contains the "error" of that chunk
+        """
+
+        cmd = "get_tx_info_multi"
+
+        async def _query(chunk: List[str]) -> JsonResponse:
+            # payment ids are separated with a | (pipe symbol)
+            return await self.api_call(cmd, txid="|".join(chunk))
+
+        # duplicated ids are queried only once
+        chunks = chunked(dict.fromkeys(txids), TX_INFO_MULTI_MAX)
+
+        return await self._gather_chunks(chunks, _query, concurrency)
+
+    async def _gather_chunks(
+        self,
+        chunks: Iterable[list],
+        query: Callable[[list], Awaitable[JsonResponse]],
+        concurrency: int,
+        writes: bool = False,
+    ) -> JsonResponse:
+        """
+        run query on every chunk of keys with bounded concurrency and merge the results,
+        the keys of a failed chunk are mapped to the error of that chunk. If writes is
+        set, the keys of a chunk that failed after it may have reached the api are also
+        flagged with "outcome_unknown"
+        """
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _run(chunk: list) -> dict:
+            async with semaphore:
+                try:
+                    response = await query(chunk)
+                    response.raise_for_errors()
+                except Exception as e:
+                    # an undecodable response included, one chunk failing must not
+                    # lose the results of the others
+                    error = {"error": str(e) or type(e).__name__}
+                    if writes and self._may_have_been_sent(e):
+                        error["outcome_unknown"] = True
+                    return {key: dict(error) for key in chunk}
+
+            return response.result
+
+        results = await asyncio.gather(*(_run(chunk) for chunk in chunks))
+
+        merged = {}
+        for result in results:
+            merged.update(result)
+
+        return JsonResponse({"error": "ok", "result": merged})
+
+    @staticmethod
+    def _may_have_been_sent(exc: BaseException) -> bool:
+        """
+        check if the request failing with exc may have been executed by the api
+        """
+
+        if isinstance(exc, CoinPayementsError):
+            # an api error or a call rejected before being sent
+            return False
+        # the connection could not be established, nothing was sent
+        return not isinstance(exc, aiohttp.ClientConnectorError)
 
     async def get_tx_info(
-        self, txid: str, full: bool = False
-    ) -> Union[JsonResponse, str]:
+        self, txid: str, full: bool = False, typed: bool = False
+    ) -> JsonResponse:
         """
         retrieves transaction informations from the CoinPayments api
 
+        Parameters
+        ----------
+        typed : bool, optional
+            if set to True the result is a TxInfo, by default False
+
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the transaction informations
         """
 
@@ -233,17 +923,23 @@ class AsynCoinPayments:
 
         params = {"txid": txid, "full": 1 if full else 0}
 
-        return await self.api_call(cmd, **params)
+        response = await self.api_call(cmd, **params)
+
+        if typed:
+            return self._typed(
+                response, "tx_info", lambda info: TxInfo.from_api(txid, info)
+            )
+        return response
 
     async def get_tx_ids(
         self, limit: int = 25, newer_than: int = 0, **params
-    ) -> Union[JsonResponse, str]:
+    ) -> JsonResponse:
         """
         retrieves the ids of from your transaction history using the CoinPayments api
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the callback address
         """
 
@@ -256,25 +952,97 @@ class AsynCoinPayments:
 
         return await self.api_call(cmd, **aux_params, **params)
 
+    async def _iter_pages(
+        self, fetch: Callable[..., Awaitable[JsonResponse]], page_size: int, start: int
+    ) -> AsyncIterator[list]:
+        """
+        lazily walk a paginated history endpoint, the next page is requested while
+        the caller is still handling the current one, so at most two pages are held
+        """
+
+        next_page = asyncio.ensure_future(fetch(limit=page_size, start=start))
+
+        try:
+            while next_page is not None:
+                response = await next_page
+                next_page = None
+                response.raise_for_errors()
+
+                page = response.result or []
+                # a single entry list can't be told apart from a dict in xml
+                if isinstance(page, dict):
+                    page = list(page.values())
+                start += len(page)
+
+                # a short page is the last one
+                if len(page) >= page_size:
+                    next_page = asyncio.ensure_future(
+                        fetch(limit=page_size, start=start)
+                    )
+
+                yield page
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def iter_tx_ids(
+        self, newer_than: int = 0, start: int = 0, page_size: int = 100, **params
+    ) -> AsyncIterator[str]:
+        """
+        iterate over the ids of your whole transaction history, newest first,
+        fetching the pages lazily
+
+        Parameters
+        ----------
+        newer_than : int, optional
+            only return transactions created after this unix timestamp, by default 0
+        start : int, optional
+            the position to start from, to resume an interrupted walk pass the start
+            of that walk plus the number of ids it yielded, by default 0
+        page_size : int, optional
+            how many ids are requested per api call, at most 100, by default 100
+
+        Yields
+        ------
+        str
+            the transaction ids
+        """
+
+        page_size = min(page_size, 100)
+
+        async def fetch(limit: int, start: int) -> JsonResponse:
+            return await self.get_tx_ids(
+                limit=limit, newer_than=newer_than, start=start, **params
+            )
+
+        async for page in self._iter_pages(fetch, page_size, start):
+            for txid in page:
+                yield txid
+
     ## WALLET
 
-    async def balances(self, all_coins: bool = False) -> Union[JsonResponse, str]:
+    async def balances(
+        self, all_coins: bool = False, typed: bool = False
+    ) -> JsonResponse:
         """
         # Retrieve the balances of your CoinPayments account
 
         if all_coins is set to True it will return all balances, even if they are equal to 0
+        if typed is set to True the result maps every coin to a Balance
         """
         cmd = "balances"
 
         # api accepts only 1/0 as True/False
         params = {"all": 1 if all_coins else 0}
 
-        return await self.api_call(cmd, **params)
+        response = await self.api_call(cmd, **params)
+
+        return self._typed(response, "balances", parse_balances) if typed else response
 
     # EXTRA
-    async def coin_balance(self, coin: str) -> Union[JsonResponse, str]:
+    async def coin_balance(self, coin: str) -> JsonResponse:
         """
-        get the current balance of a certain currency, this only works with json format
+        get the current balance of a certain currency
 
         Parameters
         ----------
@@ -283,20 +1051,15 @@ class AsynCoinPayments:
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the coin balance informations
 
         Raises
         ------
-        FormatError
-            the format passed is not json
         CoinPaymentsInputError
             the user input is incorrect, the coin passed does not exists
         """
 
-        if self._format != ResponseFormat.JSON:
-            raise FormatError
-
         user_balance = await self.balances(True)
         # TODO ADD TRY BLOCK
         result = user_balance.result
@@ -325,7 +1088,7 @@ class AsynCoinPayments:
         merchant_id: int,
         auto_confirm: bool = False,
         **params,
-    ) -> Union[JsonResponse, str]:
+    ) -> JsonResponse:
         """
         create a withdrawal to another CoinPayments user
 
@@ -342,7 +1105,7 @@ class AsynCoinPayments:
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the transfer informations
         """
 
@@ -366,7 +1129,7 @@ class AsynCoinPayments:
         ipn_url: str = None,
         auto_confirm: bool = False,
         **params,
-    ) -> Union[JsonResponse, str]:
+    ) -> JsonResponse:
         """
         create a withdrawal and send or transfer your funds to others
 
@@ -387,7 +1150,7 @@ class AsynCoinPayments:
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing containing the withdrawal info
 
         Example
@@ -410,10 +1173,58 @@ class AsynCoinPayments:
 
         return await self.api_call(cmd, **necessary_params)
 
-    async def create_mass_withdrawal(self, withdrawals: list):
+    async def create_mass_withdrawal(
+        self,
+        withdrawals: Union[Mapping[str, dict], Iterable[dict]],
+        chunk_size: int = MASS_WITHDRAWAL_MAX,
+        concurrency: int = 2,
+    ) -> JsonResponse:
+        """
+        create many withdrawals at once, large batches are split in chunks sent
+        concurrently
+
+        Parameters
+        ----------
+        withdrawals : Union[Mapping[str, dict], Iterable[dict]]
+            the withdrawals keyed by your own withdrawal ids, each with the same fields
+            as create_withdrawal (amount, currency, address or pbntag, ...), if a list is
+            passed the ids are wd1, wd2, ...
+        chunk_size : int, optional
+            the maximum number of withdrawals sent in a single api call, by default MASS_WITHDRAWAL_MAX
+        concurrency : int, optional
+            the maximum number of chunks sent at the same time, by default 2
+
+        Returns
+        -------
+        JsonResponse
+            api response whose result maps every withdrawal id to its own "error" and,
+            on success, its CoinPayments id, status and amount. The entries of a chunk
+            whose request failed in transit (disconnection, timeout, 5xx) after it may
+            have been executed also have "outcome_unknown" set to True: they must not
+            be sent again but reconciled through get_withdrawal_history, or they could
+            be paid twice
+        """
+
         cmd = "create_mass_withdrawal"
 
-        # withdrawals is an associative array
+        if not isinstance(withdrawals, Mapping):
+            withdrawals = {f"wd{i}": wd for i, wd in enumerate(withdrawals, start=1)}
+
+        async def _send_chunk(ids: List[str]) -> JsonResponse:
+            # withdrawals is an associative array sent as wd[ID][field] parameters
+            params = {}
+            for wd_id in ids:
+                prefix = f"wd[{wd_id}]["
+                for field, value in withdrawals[wd_id].items():
+                    if isinstance(value, bool):
+                        value = 1 if value else 0
+                    params[f"{prefix}{field}]"] = value
+
+            return await self.api_call(cmd, **params)
+
+        chunks = chunked(withdrawals, chunk_size)
+
+        return await self._gather_chunks(chunks, _send_chunk, concurrency, writes=True)
 
     async def cancel_withdrawal(self, withdrawal_id: int):
         """
@@ -431,7 +1242,7 @@ class AsynCoinPayments:
         to_currency: str,
         to_address: str = None,
         **params,
-    ) -> Union[JsonResponse, str]:
+    ) -> JsonResponse:
         """
         convert a currency to another and if passed, send it to another address
 
@@ -448,7 +1259,7 @@ class AsynCoinPayments:
 
         Returns
         -------
-        Union[JsonResponse, str]
+        JsonResponse
             api response containing the convertion informations
         """
 
@@ -473,16 +1284,64 @@ class AsynCoinPayments:
     async def get_withdrawal_history(
         self, limit: int = 25, newer_than: int = 0, **params
     ):
+        if limit > 100:
+            limit = 100
+
         cmd = "get_withdrawal_history"
 
         aux_params = {"limit": limit, "newer": newer_than}
 
         return await self.api_call(cmd, **aux_params, **params)
 
-    async def get_withdrawal_info(self, withdrawal_id: int):
+    async def iter_withdrawal_history(
+        self, newer_than: int = 0, start: int = 0, page_size: int = 100, **params
+    ) -> AsyncIterator[dict]:
+        """
+        iterate over your whole withdrawal history, newest first, fetching the pages lazily
+
+        Parameters
+        ----------
+        newer_than : int, optional
+            only return withdrawals created after this unix timestamp, by default 0
+        start : int, optional
+            the position to start from, to resume an interrupted walk pass the start
+            of that walk plus the number of withdrawals it yielded, by default 0
+        page_size : int, optional
+            how many withdrawals are requested per api call, at most 100, by default 100
+
+        Yields
+        ------
+        dict
+            the withdrawals informations
+        """
+
+        page_size = min(page_size, 100)
+
+        async def fetch(limit: int, start: int) -> JsonResponse:
+            return await self.get_withdrawal_history(
+                limit=limit, newer_than=newer_than, start=start, **params
+            )
+
+        async for page in self._iter_pages(fetch, page_size, start):
+            for withdrawal in page:
+                yield withdrawal
+
+    async def get_withdrawal_info(self, withdrawal_id: int, typed: bool = False):
+        """
+        if typed is set to True the result is a WithdrawalInfo
+        """
+
         cmd = "get_withdrawal_info"
 
-        return await self.api_call(cmd, id=withdrawal_id)
+        response = await self.api_call(cmd, id=withdrawal_id)
+
+        if typed:
+            return self._typed(
+                response,
+                "withdrawal_info",
+                lambda info: WithdrawalInfo.from_api(withdrawal_id, info),
+            )
+        return response
 
     async def get_conversion_info(self, conversion_id):
         cmd = "get_conversion_info"
@@ -560,20 +1419,47 @@ class AsynCoinPayments:
         return await self.api_call(cmd, coupon=coupon)
 
     # EXTRA
-    async def get_accepted_list(self, fiat_included: bool = True) -> list:
-        api_response = await self.rates()
-        accepted_currencies = api_response.result
-
-        if not fiat_included:
-            accepted_list = [
-                c for c in accepted_currencies if accepted_currencies[c]["is_fiat"] == 0
-            ]
-        else:
-            accepted_list = [c for c in accepted_currencies]
+    async def rates_snapshot(self, only_accepted: bool = False) -> RatesSnapshot:
+        """
+        Build an indexed snapshot of the current rates, it can be passed to the rates
+        helpers so that they stop fetching and re-parsing the rates on every call
 
-        return accepted_list
+        Parameters
+        ----------
+        only_accepted : bool, optional
+            If set to True only the currencies accepted by the merchant are included, by default False
 
-    async def is_accepted(self, currency: str, fiat_included: bool = True) -> bool:
+        Returns
+        -------
+        RatesSnapshot
+            the parsed rates, with the accepted flag of every currency
+        """
+
+        api_response = await self.rates(
+            specify_accepted=True, only_accepted=only_accepted
+        )
+
+        return RatesSnapshot.from_response(api_response)
+
+    async def _accepted_snapshot(self, snapshot: RatesSnapshot) -> RatesSnapshot:
+        if snapshot is None:
+            snapshot = RatesSnapshot.from_response(await self.rates())
+
+        return snapshot
+
+    async def get_accepted_list(
+        self, fiat_included: bool = True, snapshot: RatesSnapshot = None
+    ) -> list:
+        snapshot = await self._accepted_snapshot(snapshot)
+
+        return snapshot.accepted_list(fiat_included=fiat_included)
+
+    async def is_accepted(
+        self,
+        currency: str,
+        fiat_included: bool = True,
+        snapshot: RatesSnapshot = None,
+    ) -> bool:
         """
         Check if a currency is accepted by the merchant
 
@@ -583,33 +1469,27 @@ class AsynCoinPayments:
             The currency that needs to be checked
         fiat_included : bool, optional
             If the command should accept fiat currencies as an input, by default True
+        snapshot : RatesSnapshot, optional
+            A previously built rates snapshot, if not passed an api call to the rates endpoint will be made, by default None
 
         Returns
         -------
         bool
             True if the currency passed is accepted by the merchant else False
         """
-        currency = currency.upper()
-        api_response = await self.rates()
-        accepted_currencies = api_response.result
-
-        if not fiat_included:
-            accepted_currencies = {
-                c: "accepted"
-                for c in accepted_currencies
-                if accepted_currencies[c]["is_fiat"] == 0
-            }
+        snapshot = await self._accepted_snapshot(snapshot)
 
-        try:
-            accepted_currencies[currency]
-            return True
-        except KeyError:
-            return False
+        return snapshot.is_accepted(currency, fiat_included=fiat_included)
 
-    async def get_balance_accepted(self) -> dict:
+    async def get_balance_accepted(self, snapshot: RatesSnapshot = None) -> dict:
         """
         Get the balance of the accepted currencies by the merchant
 
+        Parameters
+        ----------
+        snapshot : RatesSnapshot, optional
+            A previously built rates snapshot, if not passed an api call to the rates endpoint will be made, by default None
+
         Returns
         -------
         dict
@@ -617,7 +1497,7 @@ class AsynCoinPayments:
 
         """
 
-        accepted = await self.get_accepted_list()
+        accepted = await self.get_accepted_list(snapshot=snapshot)
         api_response = await self.balances()
         balances = api_response.result
         accepted_balances = {}
@@ -629,7 +1509,11 @@ class AsynCoinPayments:
         return accepted_balances
 
     async def conversion_fiat(
-        self, coin1: str, base_currency: str, from_data: dict = None
+        self,
+        coin1: str,
+        base_currency: str,
+        from_data: dict = None,
+        snapshot: RatesSnapshot = None,
     ) -> float:
         """
         Get the conversion rate in a fiat currency of any currency accepted by CoinPayments
@@ -642,6 +1526,8 @@ class AsynCoinPayments:
             The currency, should be fiat, against which we want to compare coin1
         from_data : dict, optional
             A previous cached call of the rates endpoint if not passed an api call to said endpoint will be made, by default None
+        snapshot : RatesSnapshot, optional
+            A previously built rates snapshot, takes precedence over from_data, by default None
 
         Returns
         -------
@@ -653,29 +1539,33 @@ class AsynCoinPayments:
         CoinPaymentsInputError
             If the currencies passed do not exist or are not accepted by CoinPayments
         """
-        if from_data:
-            rates = from_data
-        else:
-            api_response = await self.rates()
-            rates = api_response.result
+        if snapshot is None and from_data:
+            # two lookups, building a whole snapshot for them would parse every coin
+            try:
+                coin1_rate = from_data[coin1.upper()]
+                base_rate = from_data[base_currency.upper()]
+            except KeyError:
+                raise CoinPaymentsInputError("User input is incorrect")
 
-        coin1 = coin1.upper()
-        base_currency = base_currency.upper()
+            return self._rate_btc(coin1_rate) / self._rate_btc(base_rate)
 
-        try:
-            coin1_btc = float(rates[coin1]["rate_btc"])
-            base_currency_btc = float(rates[base_currency]["rate_btc"])
-        except KeyError:
-            raise CoinPaymentsInputError("User input is incorrect")
+        if snapshot is None:
+            snapshot = RatesSnapshot.from_response(await self.rates())
 
-        rate = coin1_btc / base_currency_btc
-        return rate
+        return snapshot.rate(coin1, base_currency)
+
+    @staticmethod
+    def _rate_btc(info: Union[dict, Rate]) -> float:
+        if isinstance(info, Rate):
+            return float(info.rate_btc)
+        return float(info["rate_btc"])
 
     async def balances_fiat(
         self,
         base_currency: str = "USD",
         only_accepted: bool = False,
         all_coins: bool = False,
+        snapshot: RatesSnapshot = None,
     ) -> dict:
         """
         Get the merchant's balances converted in a set base currency
@@ -688,6 +1578,8 @@ class AsynCoinPayments:
             If set to True the function will return only the balances of the merchant's accepted coins, by default False
         all_coins : bool, optional
             If set to True the function will return all balances, even if empty, by default False
+        snapshot : RatesSnapshot, optional
+            A previously built rates snapshot, if not passed an api call to the rates endpoint will be made, by default None
 
         Returns
         -------
@@ -695,24 +1587,17 @@ class AsynCoinPayments:
             A dictionary containing the merchant's coin balances converted in the base currency
         """
 
-        new_balances = {}
         balances_api_response = await self.balances(all_coins=all_coins)
         balances = balances_api_response.result
-        # we call this function once and cache the result
-        rates_api_response = await self.rates(only_accepted=only_accepted)
-        rates = rates_api_response.result
 
-        for coin in rates:
-            try:
-                exchangerate = await self.conversion_fiat(
-                    coin1=coin, base_currency=base_currency, from_data=rates
-                )
-                coin_balance = float(balances[coin]["balancef"])
-            except KeyError:
-                continue
-            except CoinPayementsError:
-                continue
-            else:
-                new_balances |= {coin: exchangerate * coin_balance}
+        if snapshot is None:
+            # we call the rates endpoint once and convert every balance against it
+            rates_api_response = await self.rates(only_accepted=only_accepted)
+            snapshot = RatesSnapshot.from_response(rates_api_response)
 
-        return new_balances
+        try:
+            return snapshot.convert_balances(
+                balances, base_currency, only_accepted=only_accepted
+            )
+        except CoinPayementsError:
+            return {}
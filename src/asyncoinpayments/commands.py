@@ -0,0 +1,123 @@
+"""
+Classification of the CoinPayments api commands, shared by the features layered
+under ``AsynCoinPayments.api_call``
+"""
+
+# commands that only read the state of the account, identical concurrent calls of
+# these can share a single round trip
+READ_ONLY_COMMANDS = frozenset(
+    {
+        "get_basic_info",
+        "rates",
+        "get_tx_info",
+        "get_tx_info_multi",
+        "get_tx_ids",
+        "balances",
+        "get_deposit_address",
+        "convert_limits",
+        "get_withdrawal_history",
+        "get_withdrawal_info",
+        "get_conversion_info",
+        "get_pbn_info",
+        "get_pbn_list",
+    }
+)
+
+# default time to live, in seconds, of the cacheable read only commands
+CACHE_TTLS = {
+    "rates": 60.0,
+    "balances": 15.0,
+    "get_basic_info": 3600.0,
+    "get_pbn_list": 300.0,
+    "convert_limits": 300.0,
+    "get_withdrawal_info": 30.0,
+}
+
+# commands that change the state of the account and the cached commands they make stale
+WRITE_INVALIDATIONS = {
+    "create_transfer": ("balances",),
+    "create_withdrawal": ("balances",),
+    "create_mass_withdrawal": ("balances",),
+    "cancel_withdrawal": ("balances", "get_withdrawal_info"),
+    "convert": ("balances",),
+    "buy_pbn_tags": ("balances", "get_pbn_list"),
+    "claim_pbn_tag": ("get_pbn_list",),
+    "update_pbn_tag": ("get_pbn_list",),
+    "renew_pbn_tag": ("balances", "get_pbn_list"),
+    "delete_pbn_tag": ("get_pbn_list",),
+    "claim_pbn_coupon": ("get_pbn_list",),
+}
+
+# priority lanes of the request scheduler, lower values are served first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+COMMAND_PRIORITIES = {
+    # payouts and checkout paths must not queue behind bulk polling
+    "create_withdrawal": PRIORITY_HIGH,
+    "create_mass_withdrawal": PRIORITY_HIGH,
+    "create_transfer": PRIORITY_HIGH,
+    "cancel_withdrawal": PRIORITY_HIGH,
+    "convert": PRIORITY_HIGH,
+    "create_transaction": PRIORITY_HIGH,
+    "get_callback_address": PRIORITY_HIGH,
+    # bulk polling and history walks
+    "get_tx_info": PRIORITY_LOW,
+    "get_tx_info_multi": PRIORITY_LOW,
+    "get_tx_ids": PRIORITY_LOW,
+    "get_withdrawal_history": PRIORITY_LOW,
+}
+
+# commands that create something new on every call, retrying them after the request
+# reached the api could duplicate payouts, invoices or addresses
+NON_IDEMPOTENT_COMMANDS = frozenset(
+    {
+        "create_transaction",
+        "get_callback_address",
+        "create_transfer",
+        "create_withdrawal",
+        "create_mass_withdrawal",
+        "convert",
+        "buy_pbn_tags",
+        "claim_pbn_tag",
+        "renew_pbn_tag",
+        "claim_pbn_coupon",
+    }
+)
+
+# the sections of the api, the circuit breaker tracks the health of each one apart
+# since they are served by different backends and degrade independently
+COMMAND_GROUPS = {
+    "get_basic_info": "info",
+    "rates": "info",
+    "create_transaction": "payments",
+    "get_callback_address": "payments",
+    "get_tx_info": "payments",
+    "get_tx_info_multi": "payments",
+    "get_tx_ids": "payments",
+    "balances": "wallet",
+    "get_deposit_address": "wallet",
+    "create_transfer": "wallet",
+    "create_withdrawal": "wallet",
+    "create_mass_withdrawal": "wallet",
+    "cancel_withdrawal": "wallet",
+    "convert": "wallet",
+    "convert_limits": "wallet",
+    "get_withdrawal_history": "wallet",
+    "get_withdrawal_info": "wallet",
+    "get_conversion_info": "wallet",
+    "get_pbn_info": "pbn",
+    "get_pbn_list": "pbn",
+    "buy_pbn_tags": "pbn",
+    "claim_pbn_tag": "pbn",
+    "update_pbn_tag": "pbn",
+    "renew_pbn_tag": "pbn",
+    "delete_pbn_tag": "pbn",
+    "claim_pbn_coupon": "pbn",
+}
+DEFAULT_GROUP = "other"
+
+# slow changing commands whose last good responses are kept on disk, a restarted
+# client serves them stale while the live ones are fetched
+WARM_START_COMMANDS = frozenset({"rates", "get_basic_info"})
@@ -1,4 +1,4 @@
-class CoinPayementsError(BaseException):
+class CoinPayementsError(Exception):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
 
@@ -11,3 +11,19 @@ class CoinPaymentsInputError(CoinPayementsError):
 class FormatError(CoinPayementsError):
     def __init__(self, *args: object) -> None:
         super().__init__(*args)
+
+
+class IpnVerificationError(CoinPayementsError):
+    def __init__(self, *args: object) -> None:
+        super().__init__(*args)
+
+
+class CircuitOpenError(CoinPayementsError):
+    def __init__(
+        self, group: str, retry_after: float = 0.0, shed: bool = False
+    ) -> None:
+        self.group = group
+        self.retry_after = retry_after  # seconds until a trial request is allowed
+        self.shed = shed  # True if a low priority call was dropped by load shedding
+        reason = "shedding low priority calls" if shed else "circuit open"
+        super().__init__(f"{group}: {reason}, retry after {retry_after:.1f}s")
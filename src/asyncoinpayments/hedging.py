@@ -0,0 +1,167 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterable, Optional, TypeVar
+
+from .commands import READ_ONLY_COMMANDS
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """
+    The latencies of the last ``window`` requests of a cmd, the percentile is
+    recomputed only every ``refresh`` samples so that reading it stays cheap
+    """
+
+    def __init__(self, window: int = 200, refresh: int = 16) -> None:
+        self.window = window
+        self.refresh = refresh
+        self._samples: Dict[str, Deque[float]] = {}
+        self._since_refresh: Dict[str, int] = {}
+        # (cmd, percentile) -> latency
+        self._percentiles: Dict[tuple, float] = {}
+
+    def record(self, cmd: str, latency: float) -> None:
+        samples = self._samples.get(cmd)
+        if samples is None:
+            samples = self._samples[cmd] = deque(maxlen=self.window)
+            self._since_refresh[cmd] = 0
+
+        samples.append(latency)
+        self._since_refresh[cmd] += 1
+
+    def count(self, cmd: str) -> int:
+        samples = self._samples.get(cmd)
+        return len(samples) if samples is not None else 0
+
+    def percentile(self, cmd: str, q: float) -> Optional[float]:
+        samples = self._samples.get(cmd)
+        if not samples:
+            return None
+
+        key = (cmd, q)
+        value = self._percentiles.get(key)
+
+        if value is None or self._since_refresh[cmd] >= self.refresh:
+            ordered = sorted(samples)
+            value = ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+            self._percentiles[key] = value
+            self._since_refresh[cmd] = 0
+
+        return value
+
+
+class HedgePolicy:
+    """
+    Decides when a second identical request is sent for a slow idempotent read
+
+    If the first request has not answered once the given percentile of the recent
+    latencies of its cmd has passed, the same request is sent again and whichever
+    answers first is used, the other one is cancelled. At most ``max_ratio`` of the
+    requests are hedged so that a general slowdown doesn't double the load
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        min_samples: int = 20,
+        min_delay: float = 0.01,
+        max_ratio: float = 0.1,
+        window: int = 200,
+        commands: Iterable[str] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        percentile : float, optional
+            the percentile of the recent latencies after which a request is hedged, by default 95.0
+        min_samples : int, optional
+            a cmd is not hedged until this many latencies were recorded, by default 20
+        min_delay : float, optional
+            the minimum wait in seconds before hedging, by default 0.01
+        max_ratio : float, optional
+            the maximum fraction of the requests that are hedged, by default 0.1
+        window : int, optional
+            the number of recent latencies kept for each cmd, by default 200
+        commands : Iterable[str], optional
+            the commands that may be hedged, by default the read only commands
+        """
+
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_ratio = max_ratio
+        self.commands = (
+            frozenset(commands) if commands is not None else READ_ONLY_COMMANDS
+        )
+        self.latencies = LatencyTracker(window)
+
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def applies(self, cmd: str) -> bool:
+        return cmd in self.commands
+
+    def delay(self, cmd: str) -> Optional[float]:
+        """
+        how long to wait for the first request before hedging, None if cmd can't
+        be hedged yet
+        """
+
+        if self.latencies.count(cmd) < self.min_samples:
+            return None
+        return max(self.min_delay, self.latencies.percentile(cmd, self.percentile))
+
+    async def run(self, cmd: str, send: Callable[[], Awaitable[T]]) -> T:
+        """
+        await send(), calling it a second time if the first call is too slow
+        """
+
+        self.requests += 1
+        delay = self.delay(cmd)
+        start = time.perf_counter()
+
+        if delay is None:
+            result = await send()
+            self.latencies.record(cmd, time.perf_counter() - start)
+            return result
+
+        first = asyncio.ensure_future(send())
+        started = {first: start}
+
+        try:
+            done, _ = await asyncio.wait((first,), timeout=delay)
+            if not done and self.hedges < self.max_ratio * self.requests:
+                self.hedges += 1
+                second = asyncio.ensure_future(send())
+                started[second] = time.perf_counter()
+
+            pending = set(started)
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+
+                for task in done:
+                    if not task.cancelled() and task.exception() is None:
+                        if task is not first:
+                            self.hedge_wins += 1
+                        self.latencies.record(cmd, time.perf_counter() - started[task])
+                        return task.result()
+
+                # both failed, or the only request did
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in started:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+        }
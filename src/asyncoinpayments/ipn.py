@@ -0,0 +1,295 @@
+"""
+Receiver of the CoinPayments Instant Payment Notifications (IPN)
+
+The notifications are form encoded POST requests signed with the HMAC-SHA512 of
+the raw body, keyed with the IPN secret of the merchant and sent in the HMAC header
+"""
+
+import asyncio
+import hashlib
+import hmac
+import logging
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from typing import Awaitable, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+from .errors import IpnVerificationError
+from .models import is_complete_status, is_failed_status
+
+logger = logging.getLogger(__name__)
+
+IpnCallback = Callable[["IpnEvent"], Awaitable[None]]
+
+
+class IpnEvent:
+    """
+    A verified notification, the common fields are typed and every field sent by the
+    api is kept in fields
+    """
+
+    __slots__ = (
+        "ipn_id",
+        "ipn_type",
+        "ipn_version",
+        "merchant",
+        "status",
+        "status_text",
+        "txn_id",
+        "fields",
+    )
+
+    def __init__(self, fields: Dict[str, str]) -> None:
+        self.fields = fields
+        self.ipn_id: str = fields.get("ipn_id", "")
+        self.ipn_type: str = fields.get("ipn_type", "")
+        self.ipn_version: str = fields.get("ipn_version", "")
+        self.merchant: str = fields.get("merchant", "")
+        self.status = int(fields.get("status", 0))
+        self.status_text: str = fields.get("status_text", "")
+        # withdrawals are identified by their id, payments by their txn_id
+        self.txn_id: str = fields.get("txn_id") or fields.get("id", "")
+
+    def __repr__(self) -> str:
+        return (
+            f"IpnEvent(ipn_id={self.ipn_id!r}, ipn_type={self.ipn_type!r}, "
+            f"txn_id={self.txn_id!r}, status={self.status})"
+        )
+
+    @property
+    def is_complete(self) -> bool:
+        return is_complete_status(self.status)
+
+    @property
+    def is_failed(self) -> bool:
+        return is_failed_status(self.status)
+
+    def decimal(self, field: str) -> Optional[Decimal]:
+        """
+        returns an amount field as an exact Decimal, None if missing or malformed
+        """
+
+        try:
+            return Decimal(self.fields[field])
+        except (KeyError, InvalidOperation):
+            return None
+
+
+class IpnVerifier:
+    """
+    Verifies and parses the raw notifications
+    """
+
+    def __init__(self, ipn_secret: str, merchant_id: str = None) -> None:
+        """
+        Parameters
+        ----------
+        ipn_secret : str
+            the IPN secret set in the merchant account settings
+        merchant_id : str, optional
+            if passed, notifications addressed to another merchant are rejected, by default None
+        """
+
+        # the key pads are derived once and the keyed hmac is copied per notification
+        self._hmac = hmac.new(ipn_secret.encode("utf-8"), digestmod=hashlib.sha512)
+        self.merchant_id = merchant_id
+
+    def signature(self, body: bytes) -> str:
+        h = self._hmac.copy()
+        h.update(body)
+        return h.hexdigest()
+
+    def verify(self, body: bytes, signature: str) -> bool:
+        if not signature:
+            return False
+        return hmac.compare_digest(self.signature(body), signature.lower())
+
+    def parse(self, body: bytes, signature: str) -> IpnEvent:
+        """
+        verify the signature of a raw notification and parse it
+
+        Raises
+        ------
+        IpnVerificationError
+            the notification is not signed with the IPN secret, is not in hmac mode or
+            is addressed to another merchant
+        """
+
+        if not self.verify(body, signature):
+            raise IpnVerificationError("HMAC signature does not match")
+
+        fields = dict(parse_qsl(body.decode("utf-8"), keep_blank_values=True))
+
+        if fields.get("ipn_mode") != "hmac":
+            raise IpnVerificationError("IPN mode is not HMAC")
+        if self.merchant_id is not None and fields.get("merchant") != self.merchant_id:
+            raise IpnVerificationError("Invalid merchant id")
+
+        return IpnEvent(fields)
+
+
+class DedupStore:
+    """
+    Bounded set of the most recently seen ipn ids
+    """
+
+    def __init__(self, maxsize: int = 100_000) -> None:
+        self.maxsize = maxsize
+        self._seen: "OrderedDict[str, None]" = OrderedDict()
+
+    def __contains__(self, ipn_id: str) -> bool:
+        return ipn_id in self._seen
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def add(self, ipn_id: str) -> None:
+        self._seen[ipn_id] = None
+        self._seen.move_to_end(ipn_id)
+
+        if len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+
+    def discard(self, ipn_id: str) -> None:
+        self._seen.pop(ipn_id, None)
+
+
+class IpnReceiver:
+    """
+    aiohttp handler of the notifications
+
+    Each notification is verified, parsed, deduplicated by ipn id and queued, then
+    the request is answered immediately; a pool of workers hands the queued events to
+    the registered callbacks. A notification is acknowledged once it is queued, so a
+    callback failure is logged and the event is not redelivered
+    """
+
+    def __init__(
+        self,
+        ipn_secret: str,
+        merchant_id: str = None,
+        workers: int = 4,
+        queue_size: int = 10_000,
+        dedup_size: int = 100_000,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        ipn_secret : str
+            the IPN secret set in the merchant account settings
+        merchant_id : str, optional
+            if passed, notifications addressed to another merchant are rejected, by default None
+        workers : int, optional
+            the number of tasks running the callbacks, by default 4
+        queue_size : int, optional
+            the maximum number of queued events, when full the notifications are refused
+            so that CoinPayments sends them again later, by default 10_000
+        dedup_size : int, optional
+            how many ipn ids are remembered to drop duplicates, by default 100_000
+        """
+
+        self.verifier = IpnVerifier(ipn_secret, merchant_id)
+        self.dedup = DedupStore(dedup_size)
+        self.callbacks: List[IpnCallback] = []
+
+        self._workers = workers
+        self._queue_size = queue_size
+        self._queue: asyncio.Queue = None
+        self._tasks: List[asyncio.Task] = []
+
+    def add_callback(self, callback: IpnCallback) -> IpnCallback:
+        """
+        register a coroutine function called with every new IpnEvent, can be used as a decorator
+        """
+
+        self.callbacks.append(callback)
+        return callback
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+
+        self._queue = asyncio.Queue(self._queue_size)
+        self._tasks = [
+            asyncio.ensure_future(self._worker()) for _ in range(self._workers)
+        ]
+
+    async def stop(self) -> None:
+        """
+        wait for the queued events to be handled, then stop the workers
+        """
+
+        if not self._tasks:
+            return
+
+        await self._queue.join()
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def __aenter__(self) -> "IpnReceiver":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def _worker(self) -> None:
+        queue = self._queue
+
+        while True:
+            event = await queue.get()
+            try:
+                for callback in self.callbacks:
+                    try:
+                        await callback(event)
+                    except Exception:
+                        logger.exception("IPN callback failed for %r", event)
+            finally:
+                queue.task_done()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        body = await request.read()
+
+        try:
+            event = self.verifier.parse(body, request.headers.get("HMAC", ""))
+        except (IpnVerificationError, UnicodeDecodeError, ValueError) as e:
+            return web.Response(status=400, text=f"IPN Error: {e}")
+
+        if event.ipn_id in self.dedup:
+            return web.Response(text="IPN OK")
+
+        if self._queue is None:
+            await self.start()
+
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return web.Response(status=503, text="IPN Error: busy")
+
+        self.dedup.add(event.ipn_id)
+
+        return web.Response(text="IPN OK")
+
+    def app(self, path: str = "/ipn") -> web.Application:
+        """
+        build an aiohttp application serving the notifications on path
+        """
+
+        app = web.Application()
+        app.router.add_post(path, self.handle)
+
+        async def _start(app: web.Application) -> None:
+            await self.start()
+
+        async def _stop(app: web.Application) -> None:
+            await self.stop()
+
+        app.on_startup.append(_start)
+        app.on_cleanup.append(_stop)
+
+        return app
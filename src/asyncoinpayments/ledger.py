@@ -0,0 +1,396 @@
+"""
+Local SQLite mirror of the transactions and withdrawals of a merchant
+
+Each sync only fetches what changed since the previous one: the transactions and
+withdrawals created after the stored watermarks, and the records stored with a
+status that can still change. Reports are then answered by indexed queries on the
+local store without touching the api
+"""
+
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+from .coinpayments import AsynCoinPayments
+from .models import TxInfo, WithdrawalInfo
+from .utils import chunked
+
+T = TypeVar("T")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    txid TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    status_text TEXT NOT NULL,
+    type TEXT NOT NULL,
+    coin TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    amount_satoshis INTEGER NOT NULL,
+    received TEXT NOT NULL,
+    received_satoshis INTEGER NOT NULL,
+    recv_confirms INTEGER NOT NULL,
+    payment_address TEXT NOT NULL,
+    time_created INTEGER NOT NULL,
+    time_expires INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transactions_status ON transactions (status);
+CREATE INDEX IF NOT EXISTS transactions_coin_time ON transactions (coin, time_created);
+CREATE INDEX IF NOT EXISTS transactions_time ON transactions (time_created);
+
+CREATE TABLE IF NOT EXISTS withdrawals (
+    id TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    status_text TEXT NOT NULL,
+    coin TEXT NOT NULL,
+    amount TEXT NOT NULL,
+    amount_satoshis INTEGER NOT NULL,
+    send_address TEXT NOT NULL,
+    send_txid TEXT NOT NULL,
+    time_created INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS withdrawals_status ON withdrawals (status);
+CREATE INDEX IF NOT EXISTS withdrawals_coin_time ON withdrawals (coin, time_created);
+CREATE INDEX IF NOT EXISTS withdrawals_time ON withdrawals (time_created);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+TX_COLUMNS = TxInfo.__slots__
+WD_COLUMNS = WithdrawalInfo.__slots__
+DECIMAL_COLUMNS = ("amount", "received")
+
+# the payments and withdrawals whose status can still change
+PENDING_TX = "status >= 0 AND status < 100 AND status != 2"
+PENDING_WD = "status >= 0 AND status != 2"
+
+# created_after watermarks are moved back by this many seconds, records created in the
+# same second as the watermark are then fetched again and simply overwritten
+WATERMARK_OVERLAP = 1
+
+
+class Ledger:
+    """
+    Incremental SQLite mirror of the history of a merchant
+
+    The database is only used from a dedicated thread, so the event loop never blocks
+    on disk
+    """
+
+    def __init__(
+        self,
+        client: AsynCoinPayments,
+        path: str = "coinpayments.sqlite3",
+        batch_size: int = 500,
+        concurrency: int = 4,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        client : AsynCoinPayments
+            the client of the merchant to mirror
+        path : str, optional
+            the SQLite database file, by default "coinpayments.sqlite3"
+        batch_size : int, optional
+            how many records are fetched and then written in a single transaction, by default 500
+        concurrency : int, optional
+            the maximum number of detail requests in flight, by default 4
+        """
+
+        self.client = client
+        self.path = path
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._connection: sqlite3.Connection = None
+
+    async def _run(self, func: Callable[..., T], *args: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def _db(self) -> sqlite3.Connection:
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path)
+            self._connection.executescript(SCHEMA)
+        return self._connection
+
+    async def close(self) -> None:
+        def _close() -> None:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+        await self._run(_close)
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> "Ledger":
+        await self._run(self._db)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    # DATABASE, only called on the ledger thread
+
+    def _watermark(self, name: str) -> int:
+        row = (
+            self._db()
+            .execute("SELECT value FROM sync_state WHERE name = ?", (name,))
+            .fetchone()
+        )
+        return row[0] if row else 0
+
+    def _pending(self, table: str, key: str, condition: str) -> List[str]:
+        query = f"SELECT {key} FROM {table} WHERE {condition}"
+        return [row[0] for row in self._db().execute(query)]
+
+    def _known(self, table: str, key: str, ids: List[str]) -> set:
+        known = set()
+        db = self._db()
+        # stay under the sqlite limit of bound parameters
+        for chunk in chunked(ids, 500):
+            marks = ",".join("?" * len(chunk))
+            query = f"SELECT {key} FROM {table} WHERE {key} IN ({marks})"
+            known.update(row[0] for row in db.execute(query, chunk))
+        return known
+
+    def _write(self, table: str, columns: tuple, rows: List[tuple]) -> None:
+        """
+        upsert rows in one transaction
+        """
+
+        if not rows:
+            return
+
+        marks = ",".join("?" * (len(columns) + 1))
+        db = self._db()
+
+        with db:
+            db.executemany(
+                f"INSERT OR REPLACE INTO {table} ({','.join(columns)}, synced_at)"
+                f" VALUES ({marks})",
+                rows,
+            )
+
+    def _advance(self, table: str) -> None:
+        """
+        move the watermark of table forward to its newest stored record, never back
+        """
+
+        db = self._db()
+        (newest,) = db.execute(f"SELECT MAX(time_created) FROM {table}").fetchone()
+        if newest is None:
+            return
+
+        with db:
+            db.execute(
+                "INSERT INTO sync_state (name, value) VALUES (?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET value = MAX(value, excluded.value)",
+                (table, newest),
+            )
+
+    def _select(
+        self,
+        table: str,
+        columns: tuple,
+        status: Optional[int],
+        coin: Optional[str],
+        since: Optional[int],
+        until: Optional[int],
+        limit: Optional[int],
+    ) -> List[tuple]:
+        conditions, params = [], []
+
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if coin is not None:
+            conditions.append("coin = ?")
+            params.append(coin.upper())
+        if since is not None:
+            conditions.append("time_created >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("time_created < ?")
+            params.append(until)
+
+        query = f"SELECT {','.join(columns)} FROM {table}"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY time_created DESC"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        return self._db().execute(query, params).fetchall()
+
+    # SYNC
+
+    @staticmethod
+    def _row(model: Any, columns: tuple, synced_at: float) -> tuple:
+        # the exact amounts are stored as text
+        values = (getattr(model, column) for column in columns)
+        return tuple(
+            str(value) if isinstance(value, Decimal) else value for value in values
+        ) + (synced_at,)
+
+    async def _sync_transactions(self) -> int:
+        newer_than = await self._run(self._watermark, "transactions")
+        pending = await self._run(self._pending, "transactions", "txid", PENDING_TX)
+
+        # the new ids are collected first, the history walk holds a single page
+        new_ids = []
+        async for txid in self.client.iter_tx_ids(
+            newer_than=max(0, newer_than - WATERMARK_OVERLAP)
+        ):
+            new_ids.append(txid)
+        known = await self._run(self._known, "transactions", "txid", new_ids)
+
+        to_fetch = [txid for txid in new_ids if txid not in known]
+        missing = set(to_fetch)  # the new ids not stored yet
+        to_fetch.extend(pending)
+        synced = 0
+
+        for batch in chunked(dict.fromkeys(to_fetch), self.batch_size):
+            response = await self.client.get_tx_info_multi(
+                batch, concurrency=self.concurrency
+            )
+            now = time.time()
+            rows = []
+            for txid, info in response.result.items():
+                if info.get("error", "ok") == "ok":
+                    rows.append(self._row(TxInfo.from_api(txid, info), TX_COLUMNS, now))
+                    missing.discard(txid)
+            await self._run(self._write, "transactions", TX_COLUMNS, rows)
+            synced += len(rows)
+
+        # the history walk only starts from the watermark, it stays put until every
+        # new transaction is stored so that a failed one is fetched again next time
+        if not missing:
+            await self._run(self._advance, "transactions")
+
+        return synced
+
+    async def _sync_withdrawals(self) -> int:
+        newer_than = await self._run(self._watermark, "withdrawals")
+        pending = await self._run(self._pending, "withdrawals", "id", PENDING_WD)
+        synced = 0
+
+        # the history already carries the whole records
+        batch = []
+        seen = set()
+        async for withdrawal in self.client.iter_withdrawal_history(
+            newer_than=max(0, newer_than - WATERMARK_OVERLAP)
+        ):
+            batch.append(WithdrawalInfo.from_api(withdrawal.get("id", ""), withdrawal))
+            seen.add(batch[-1].id)
+            if len(batch) >= self.batch_size:
+                synced += await self._write_withdrawals(batch)
+                batch = []
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _refresh(withdrawal_id: str) -> Optional[WithdrawalInfo]:
+            async with semaphore:
+                response = await self.client.get_withdrawal_info(
+                    withdrawal_id, typed=True
+                )
+            return response.result if response.error == "ok" else None
+
+        refreshed = await asyncio.gather(
+            *(_refresh(wd_id) for wd_id in pending if wd_id not in seen)
+        )
+        batch.extend(withdrawal for withdrawal in refreshed if withdrawal is not None)
+        synced += await self._write_withdrawals(batch)
+
+        # only once the whole history walk went through, a walk that failed halfway
+        # is done again from the previous watermark
+        await self._run(self._advance, "withdrawals")
+
+        return synced
+
+    async def _write_withdrawals(self, withdrawals: List[WithdrawalInfo]) -> int:
+        now = time.time()
+        rows = [self._row(wd, WD_COLUMNS, now) for wd in withdrawals]
+        await self._run(self._write, "withdrawals", WD_COLUMNS, rows)
+        return len(rows)
+
+    async def sync(self) -> Dict[str, int]:
+        """
+        fetch the new and changed records and store them
+
+        Returns
+        -------
+        Dict[str, int]
+            the number of transactions and withdrawals written
+        """
+
+        transactions, withdrawals = await asyncio.gather(
+            self._sync_transactions(), self._sync_withdrawals()
+        )
+        return {"transactions": transactions, "withdrawals": withdrawals}
+
+    # QUERIES
+
+    async def transactions(
+        self,
+        status: int = None,
+        coin: str = None,
+        since: int = None,
+        until: int = None,
+        limit: int = None,
+    ) -> List[TxInfo]:
+        """
+        the stored transactions, newest first
+
+        Parameters
+        ----------
+        status : int, optional
+            only the transactions with this status, by default None
+        coin : str, optional
+            only the transactions in this coin, by default None
+        since : int, optional
+            only the transactions created at or after this unix timestamp, by default None
+        until : int, optional
+            only the transactions created before this unix timestamp, by default None
+        limit : int, optional
+            the maximum number of transactions returned, by default None
+        """
+
+        rows = await self._run(
+            self._select, "transactions", TX_COLUMNS, status, coin, since, until, limit
+        )
+        return [_model(TxInfo, TX_COLUMNS, row) for row in rows]
+
+    async def withdrawals(
+        self,
+        status: int = None,
+        coin: str = None,
+        since: int = None,
+        until: int = None,
+        limit: int = None,
+    ) -> List[WithdrawalInfo]:
+        """
+        the stored withdrawals, newest first, filtered like transactions
+        """
+
+        rows = await self._run(
+            self._select, "withdrawals", WD_COLUMNS, status, coin, since, until, limit
+        )
+        return [_model(WithdrawalInfo, WD_COLUMNS, row) for row in rows]
+
+
+def _model(cls: Callable[..., T], columns: Iterable[str], row: tuple) -> T:
+    values = {
+        column: Decimal(value) if column in DECIMAL_COLUMNS else value
+        for column, value in zip(columns, row)
+    }
+    return cls(**values)
@@ -0,0 +1,197 @@
+"""
+Local matrix of the conversion limits between the accepted coins
+
+convert_limits answers for a single pair per round trip, the matrix prefetches every
+pair concurrently and refreshes them on a schedule, so that a conversion sweep can
+check its amounts locally and only call convert for the pairs that can go through
+"""
+
+import asyncio
+import logging
+import time
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import aiohttp
+
+from .coinpayments import AsynCoinPayments
+from .errors import CoinPayementsError
+
+logger = logging.getLogger(__name__)
+
+Limits = Tuple[Decimal, Decimal]
+
+
+def _amount(value: Any) -> Decimal:
+    # the limits are sent as strings, a missing one is 0
+    return Decimal(str(value)) if value not in (None, "") else Decimal(0)
+
+
+class ConvertLimits:
+    """
+    The convert_limits of every ordered pair of a set of coins
+
+    A pair the api refuses to convert is stored as unavailable, a pair whose last
+    fetch failed keeps its previous limits until the next refresh. The limits are
+    replaced all at once at the end of a refresh, readers never see a half updated
+    matrix. Currencies are case insensitive
+    """
+
+    def __init__(
+        self,
+        client: AsynCoinPayments,
+        coins: Iterable[str] = None,
+        refresh_interval: float = 300.0,
+        concurrency: int = 8,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        client : AsynCoinPayments
+            the client of the merchant
+        coins : Iterable[str], optional
+            the coins whose pairs are fetched, by default the accepted coins, fiat excluded, at every refresh
+        refresh_interval : float, optional
+            the number of seconds between two refreshes in the background, by default 300.0
+        concurrency : int, optional
+            the maximum number of convert_limits calls in flight, by default 8
+        """
+
+        self.client = client
+        self.coins = [c.upper() for c in coins] if coins is not None else None
+        self.refresh_interval = refresh_interval
+        self.concurrency = concurrency
+
+        # (from, to) -> (min, max), None if the pair can't be converted
+        self._limits: Dict[Tuple[str, str], Optional[Limits]] = {}
+        self.refreshed_at: float = None
+
+        self._task: asyncio.Task = None
+
+    def __len__(self) -> int:
+        return len(self._limits)
+
+    async def _coins(self) -> List[str]:
+        if self.coins is not None:
+            return self.coins
+
+        snapshot = await self.client.rates_snapshot(only_accepted=True)
+        return snapshot.accepted_list(fiat_included=False)
+
+    async def refresh(self) -> None:
+        """
+        fetch the limits of every pair of coins concurrently
+        """
+
+        coins = await self._coins()
+        pairs = [(a, b) for a in coins for b in coins if a != b]
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def _fetch(pair: Tuple[str, str]) -> Optional[Limits]:
+            async with semaphore:
+                response = await self.client.convert_limits(*pair)
+
+            if response.error != "ok":
+                return None
+
+            result = response.result
+            return _amount(result.get("min")), _amount(result.get("max"))
+
+        results = await asyncio.gather(
+            *(_fetch(pair) for pair in pairs), return_exceptions=True
+        )
+
+        limits: Dict[Tuple[str, str], Optional[Limits]] = {}
+        failed = 0
+        for pair, result in zip(pairs, results):
+            if isinstance(result, BaseException):
+                failed += 1
+                if pair in self._limits:
+                    limits[pair] = self._limits[pair]
+                continue
+            limits[pair] = result
+
+        if failed:
+            logger.warning(
+                "fetching %d of %d convert limits failed", failed, len(pairs)
+            )
+
+        self._limits = limits
+        self.refreshed_at = time.time()
+
+    def limits(self, from_currency: str, to_currency: str) -> Optional[Limits]:
+        """
+        the (min, max) amounts of from_currency that can be converted to to_currency,
+        None if the pair is unknown or can't be converted
+        """
+
+        return self._limits.get((from_currency.upper(), to_currency.upper()))
+
+    def can_convert(
+        self,
+        from_currency: str,
+        to_currency: str,
+        amount: Union[Decimal, float, str],
+    ) -> bool:
+        """
+        check locally if amount of from_currency is within the limits of the pair,
+        a max of 0 is treated as the pair being unavailable
+        """
+
+        limits = self.limits(from_currency, to_currency)
+        if limits is None:
+            return False
+
+        if not isinstance(amount, Decimal):
+            amount = Decimal(str(amount))
+
+        low, high = limits
+        return high > 0 and low <= amount <= high
+
+    def pairs(self, from_currency: str = None) -> List[Tuple[str, str]]:
+        """
+        the pairs that can be converted, only those from from_currency if passed
+        """
+
+        if from_currency is not None:
+            from_currency = from_currency.upper()
+
+        return [
+            pair
+            for pair, limits in self._limits.items()
+            if limits is not None and limits[1] > 0
+            if from_currency is None or pair[0] == from_currency
+        ]
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except (CoinPayementsError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning("refreshing the convert limits failed: %s", e)
+
+    async def start(self) -> None:
+        """
+        fetch the limits, then keep refreshing them in the background
+        """
+
+        if self._task is None:
+            await self.refresh()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self) -> "ConvertLimits":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
@@ -0,0 +1,261 @@
+"""
+Instrumentation of the request path
+
+Every HTTP request sent by AsynCoinPayments is reported to the observers of the
+client as a RequestEvent, with the time spent in each phase:
+
+- sign : encoding and signing of the request
+- connect : waiting for and opening a pooled connection
+- ttfb : from the request sent to the response headers received
+- read : reading the response body
+- decode : decoding the response body
+- total : the whole request
+
+The connection phases are captured through an aiohttp TraceConfig which is only
+installed when the client has observers, so a client without observers pays nothing
+"""
+
+import time
+from bisect import bisect_left
+from types import SimpleNamespace
+from typing import Dict, Iterable, Optional, Tuple
+
+import aiohttp
+
+PHASES = ("sign", "connect", "ttfb", "read", "decode", "total")
+
+# histogram buckets upper bounds, in seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+# the error of the requests cancelled before they ended, by a deadline or a hedge
+CANCELLED = "cancelled"
+
+
+class RequestEvent:
+    __slots__ = ("cmd", "start", "phases", "error")
+
+    def __init__(
+        self, cmd: str, start: float, phases: Dict[str, float], error: Optional[str]
+    ) -> None:
+        self.cmd = cmd
+        self.start = start  # unix time at which the request started
+        self.phases = phases  # phase name -> seconds
+        # None, the api error, the exception class name or CANCELLED
+        self.error = error
+
+    @property
+    def duration(self) -> float:
+        return self.phases.get("total", 0.0)
+
+
+class RequestObserver:
+    """
+    Base class of the observers, subclasses override on_request
+    """
+
+    def on_request(self, event: RequestEvent) -> None:
+        pass
+
+
+def trace_config() -> aiohttp.TraceConfig:
+    """
+    the aiohttp TraceConfig recording the connect and ttfb phases in the dict passed
+    as trace_request_ctx of a request
+    """
+
+    config = aiohttp.TraceConfig()
+
+    def _mark(key: str):
+        async def _callback(
+            session: aiohttp.ClientSession, ctx: SimpleNamespace, params: object
+        ) -> None:
+            timings = ctx.trace_request_ctx
+            if timings is not None:
+                timings[key] = time.perf_counter()
+
+        return _callback
+
+    def _elapsed(start_key: str, phase: str):
+        async def _callback(
+            session: aiohttp.ClientSession, ctx: SimpleNamespace, params: object
+        ) -> None:
+            timings = ctx.trace_request_ctx
+            if timings is not None and start_key in timings:
+                elapsed = time.perf_counter() - timings.pop(start_key)
+                timings[phase] = timings.get(phase, 0.0) + elapsed
+
+        return _callback
+
+    config.on_connection_queued_start.append(_mark("_queued"))
+    config.on_connection_queued_end.append(_elapsed("_queued", "connect"))
+    config.on_connection_create_start.append(_mark("_create"))
+    config.on_connection_create_end.append(_elapsed("_create", "connect"))
+    config.on_request_headers_sent.append(_mark("_sent"))
+    config.on_request_end.append(_elapsed("_sent", "ttfb"))
+
+    return config
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int) -> None:
+        self.counts = [0] * (buckets + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsCollector(RequestObserver):
+    """
+    Per cmd request and error counters and per phase latency histograms
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self.requests: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.histograms: Dict[Tuple[str, str], _Histogram] = {}
+
+    def on_request(self, event: RequestEvent) -> None:
+        cmd = event.cmd
+        self.requests[cmd] = self.requests.get(cmd, 0) + 1
+        if event.error is not None:
+            self.errors[cmd] = self.errors.get(cmd, 0) + 1
+
+        if event.error == CANCELLED:
+            # cut short, its duration is not a latency of the api
+            return
+
+        for phase, seconds in event.phases.items():
+            histogram = self.histograms.get((cmd, phase))
+            if histogram is None:
+                histogram = self.histograms[(cmd, phase)] = _Histogram(
+                    len(self.buckets)
+                )
+            histogram.counts[bisect_left(self.buckets, seconds)] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    def snapshot(self) -> dict:
+        """
+        Returns
+        -------
+        dict
+            the counters and, for every cmd and phase, the count, the sum and the mean in seconds
+        """
+
+        phases: Dict[str, dict] = {}
+        for (cmd, phase), histogram in self.histograms.items():
+            phases.setdefault(cmd, {})[phase] = {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "mean": histogram.sum / histogram.count,
+            }
+
+        return {
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "phases": phases,
+        }
+
+    def to_prometheus(self, prefix: str = "coinpayments") -> str:
+        """
+        the metrics in the Prometheus text exposition format
+        """
+
+        lines = [
+            f"# HELP {prefix}_requests_total Requests sent to the CoinPayments api.",
+            f"# TYPE {prefix}_requests_total counter",
+        ]
+        lines.extend(
+            f'{prefix}_requests_total{{cmd="{cmd}"}} {count}'
+            for cmd, count in self.requests.items()
+        )
+
+        lines.append(
+            f"# HELP {prefix}_request_errors_total Requests that failed or returned an api error."
+        )
+        lines.append(f"# TYPE {prefix}_request_errors_total counter")
+        lines.extend(
+            f'{prefix}_request_errors_total{{cmd="{cmd}"}} {count}'
+            for cmd, count in self.errors.items()
+        )
+
+        name = f"{prefix}_request_phase_seconds"
+        lines.append(f"# HELP {name} Time spent in each phase of the requests.")
+        lines.append(f"# TYPE {name} histogram")
+
+        bounds = [repr(b) for b in self.buckets] + ["+Inf"]
+        for (cmd, phase), histogram in sorted(self.histograms.items()):
+            labels = f'cmd="{cmd}",phase="{phase}"'
+            cumulative = 0
+            for bound, count in zip(bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+
+class OpenTelemetryObserver(RequestObserver):
+    """
+    Exports every request as an OpenTelemetry span, with one event per phase,
+    requires the opentelemetry-api package
+    """
+
+    def __init__(self, tracer=None) -> None:
+        """
+        Parameters
+        ----------
+        tracer : opentelemetry.trace.Tracer, optional
+            the tracer creating the spans, by default the tracer of this module
+        """
+
+        from opentelemetry import trace
+
+        self._trace = trace
+        self.tracer = tracer or trace.get_tracer(__name__)
+
+    def on_request(self, event: RequestEvent) -> None:
+        start_ns = int(event.start * 1e9)
+        span = self.tracer.start_span(
+            f"coinpayments {event.cmd}",
+            kind=self._trace.SpanKind.CLIENT,
+            start_time=start_ns,
+            attributes={"coinpayments.cmd": event.cmd},
+        )
+
+        elapsed = 0.0
+        for phase in PHASES[:-1]:
+            seconds = event.phases.get(phase)
+            if seconds is not None:
+                elapsed += seconds
+                span.add_event(
+                    phase,
+                    attributes={"seconds": seconds},
+                    timestamp=start_ns + int(elapsed * 1e9),
+                )
+
+        if event.error is not None:
+            span.set_status(
+                self._trace.Status(self._trace.StatusCode.ERROR, event.error)
+            )
+
+        span.end(end_time=start_ns + int(event.duration * 1e9))
@@ -0,0 +1,271 @@
+"""
+Compact typed views of the results of the most used commands
+
+The api sends amounts as strings of 8 decimals along with their integer value in
+satoshis (1e-8 units), the models keep the exact Decimal and the satoshis
+"""
+
+from decimal import Decimal
+from typing import Any, Dict, Mapping, Optional
+
+
+def _decimal(value: Any) -> Decimal:
+    return Decimal(value) if value not in (None, "") else Decimal(0)
+
+
+def _int(value: Any) -> int:
+    return int(value) if value not in (None, "") else 0
+
+
+def _satoshis(info: Mapping, field: str, field_f: str) -> int:
+    satoshis = info.get(field)
+    if satoshis is None:
+        return int(_decimal(info.get(field_f)).scaleb(8))
+    return int(satoshis)
+
+
+def is_complete_status(status: int) -> bool:
+    """
+    check if a payment status means the payment is complete, 2 means queued for
+    nightly payout which is a completed payment as well
+    """
+
+    return status >= 100 or status == 2
+
+
+def is_failed_status(status: int) -> bool:
+    return status < 0
+
+
+def is_final_status(status: int) -> bool:
+    """
+    check if a payment status can't change anymore
+    """
+
+    return is_complete_status(status) or is_failed_status(status)
+
+
+class _Model:
+    __slots__ = ()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{f}={getattr(self, f)!r}" for f in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other: object) -> bool:
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, f) == getattr(other, f) for f in self.__slots__)
+
+
+class Balance(_Model):
+    __slots__ = ("coin", "amount", "satoshis", "status", "coin_status")
+
+    def __init__(
+        self,
+        coin: str,
+        amount: Decimal,
+        satoshis: int,
+        status: str = "",
+        coin_status: str = "",
+    ) -> None:
+        self.coin = coin
+        self.amount = amount
+        self.satoshis = satoshis
+        self.status = status
+        self.coin_status = coin_status
+
+    @classmethod
+    def from_api(cls, coin: str, info: Mapping) -> "Balance":
+        return cls(
+            coin=coin,
+            amount=_decimal(info.get("balancef")),
+            satoshis=_satoshis(info, "balance", "balancef"),
+            status=info.get("status", ""),
+            coin_status=info.get("coin_status", ""),
+        )
+
+
+class Rate(_Model):
+    __slots__ = (
+        "coin",
+        "rate_btc",
+        "is_fiat",
+        "accepted",
+        "tx_fee",
+        "status",
+        "last_update",
+    )
+
+    def __init__(
+        self,
+        coin: str,
+        rate_btc: Decimal,
+        is_fiat: bool,
+        accepted: Optional[bool] = None,
+        tx_fee: Decimal = Decimal(0),
+        status: str = "",
+        last_update: int = 0,
+    ) -> None:
+        self.coin = coin
+        self.rate_btc = rate_btc
+        self.is_fiat = is_fiat
+        # None when the rates were requested without the accepted flag
+        self.accepted = accepted
+        self.tx_fee = tx_fee
+        self.status = status
+        self.last_update = last_update
+
+    @classmethod
+    def from_api(cls, coin: str, info: Mapping) -> "Rate":
+        accepted = info.get("accepted")
+
+        return cls(
+            coin=coin,
+            rate_btc=_decimal(info.get("rate_btc")),
+            is_fiat=bool(_int(info.get("is_fiat"))),
+            accepted=None if accepted is None else bool(_int(accepted)),
+            tx_fee=_decimal(info.get("tx_fee")),
+            status=info.get("status", ""),
+            last_update=_int(info.get("last_update")),
+        )
+
+
+class TxInfo(_Model):
+    __slots__ = (
+        "txid",
+        "status",
+        "status_text",
+        "type",
+        "coin",
+        "amount",
+        "amount_satoshis",
+        "received",
+        "received_satoshis",
+        "recv_confirms",
+        "payment_address",
+        "time_created",
+        "time_expires",
+    )
+
+    def __init__(
+        self,
+        txid: str,
+        status: int,
+        status_text: str,
+        type: str,
+        coin: str,
+        amount: Decimal,
+        amount_satoshis: int,
+        received: Decimal,
+        received_satoshis: int,
+        recv_confirms: int,
+        payment_address: str,
+        time_created: int,
+        time_expires: int,
+    ) -> None:
+        self.txid = txid
+        self.status = status
+        self.status_text = status_text
+        self.type = type
+        self.coin = coin
+        self.amount = amount
+        self.amount_satoshis = amount_satoshis
+        self.received = received
+        self.received_satoshis = received_satoshis
+        self.recv_confirms = recv_confirms
+        self.payment_address = payment_address
+        self.time_created = time_created
+        self.time_expires = time_expires
+
+    @classmethod
+    def from_api(cls, txid: str, info: Mapping) -> "TxInfo":
+        return cls(
+            txid=txid,
+            status=_int(info.get("status")),
+            status_text=info.get("status_text", ""),
+            type=info.get("type", ""),
+            coin=info.get("coin", ""),
+            amount=_decimal(info.get("amountf")),
+            amount_satoshis=_satoshis(info, "amount", "amountf"),
+            received=_decimal(info.get("receivedf")),
+            received_satoshis=_satoshis(info, "received", "receivedf"),
+            recv_confirms=_int(info.get("recv_confirms")),
+            payment_address=info.get("payment_address", ""),
+            time_created=_int(info.get("time_created")),
+            time_expires=_int(info.get("time_expires")),
+        )
+
+    @property
+    def is_complete(self) -> bool:
+        return is_complete_status(self.status)
+
+    @property
+    def is_failed(self) -> bool:
+        return is_failed_status(self.status)
+
+
+class WithdrawalInfo(_Model):
+    __slots__ = (
+        "id",
+        "status",
+        "status_text",
+        "coin",
+        "amount",
+        "amount_satoshis",
+        "send_address",
+        "send_txid",
+        "time_created",
+    )
+
+    def __init__(
+        self,
+        id: str,
+        status: int,
+        status_text: str,
+        coin: str,
+        amount: Decimal,
+        amount_satoshis: int,
+        send_address: str,
+        send_txid: str,
+        time_created: int,
+    ) -> None:
+        self.id = id
+        self.status = status
+        self.status_text = status_text
+        self.coin = coin
+        self.amount = amount
+        self.amount_satoshis = amount_satoshis
+        self.send_address = send_address
+        self.send_txid = send_txid
+        self.time_created = time_created
+
+    @classmethod
+    def from_api(cls, withdrawal_id: str, info: Mapping) -> "WithdrawalInfo":
+        return cls(
+            id=str(info.get("id", withdrawal_id)),
+            status=_int(info.get("status")),
+            status_text=info.get("status_text", ""),
+            coin=info.get("coin", ""),
+            amount=_decimal(info.get("amountf")),
+            amount_satoshis=_satoshis(info, "amount", "amountf"),
+            send_address=info.get("send_address", ""),
+            send_txid=info.get("send_txid", ""),
+            time_created=_int(info.get("time_created")),
+        )
+
+    @property
+    def is_complete(self) -> bool:
+        return self.status == 2
+
+    @property
+    def is_failed(self) -> bool:
+        return self.status < 0
+
+
+def parse_balances(result: Mapping[str, Mapping]) -> Dict[str, Balance]:
+    return {coin: Balance.from_api(coin, info) for coin, info in result.items()}
+
+
+def parse_rates(result: Mapping[str, Mapping]) -> Dict[str, Rate]:
+    return {coin: Rate.from_api(coin, info) for coin, info in result.items()}
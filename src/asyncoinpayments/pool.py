@@ -0,0 +1,254 @@
+import asyncio
+from collections import defaultdict
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Mapping,
+    Tuple,
+)
+
+import aiohttp
+
+from .coinpayments import AsynCoinPayments, create_session
+from .errors import CoinPaymentsInputError
+from .metrics import RequestObserver
+from .retry import RetryPolicy
+from .scheduler import RequestScheduler
+
+MerchantCall = Callable[[AsynCoinPayments], Awaitable[Any]]
+
+
+class AsynCoinPaymentsPool:
+    """
+    Many merchant accounts over one shared connection pool, scheduler and retry
+    policy, with bulk operations fanned out across the merchants
+
+    The bulk operations yield (merchant, result) pairs as soon as each merchant
+    answers, result is the exception raised for that merchant if its call failed
+    """
+
+    def __init__(
+        self,
+        merchants: Mapping[str, Tuple[str, str]] = None,
+        scheduler: RequestScheduler = None,
+        retry_policy: RetryPolicy = None,
+        observers: Iterable[RequestObserver] = None,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 0,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        **client_options,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        merchants : Mapping[str, Tuple[str, str]], optional
+            the merchants names mapped to their (private_key, public_key) pairs, by default None
+        scheduler : RequestScheduler, optional
+            the rate limiter shared by every merchant, by default a RequestScheduler with its default limits
+        retry_policy : RetryPolicy, optional
+            the retry policy shared by every merchant, by default the client default
+        observers : Iterable[RequestObserver], optional
+            notified of the timings of the requests of every merchant, by default None
+        client_options :
+            any other AsynCoinPayments option, applied to every merchant
+        """
+
+        # the api limits the calls per ip, the merchants share a single budget
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.retry_policy = retry_policy
+        self.observers = list(observers or ())
+        self._client_options = client_options
+        self._session_options = {
+            "connection_limit": connection_limit,
+            "connection_limit_per_host": connection_limit_per_host,
+            "keepalive_timeout": keepalive_timeout,
+            "dns_cache_ttl": dns_cache_ttl,
+        }
+        self._session: aiohttp.ClientSession = None
+
+        self._keys: Dict[str, Tuple[str, str]] = dict(merchants or {})
+        self._clients: Dict[str, AsynCoinPayments] = {}
+
+    async def __aenter__(self) -> "AsynCoinPaymentsPool":
+        self._get_session()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, merchant: str) -> bool:
+        return merchant in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __getitem__(self, merchant: str) -> AsynCoinPayments:
+        return self.client(merchant)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = create_session(
+                **self._session_options, traced=bool(self.observers)
+            )
+            # the clients built over the closed session are rebuilt on demand
+            self._clients.clear()
+
+        return self._session
+
+    async def close(self) -> None:
+        """
+        close the clients of the merchants, then the shared session
+        """
+
+        clients = list(self._clients.values())
+        self._clients.clear()
+
+        try:
+            results = await asyncio.gather(
+                *(client.close() for client in clients), return_exceptions=True
+            )
+        finally:
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+            self._session = None
+
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+
+    def add(self, merchant: str, private_key: str, public_key: str) -> None:
+        self._keys[merchant] = (private_key, public_key)
+        self._clients.pop(merchant, None)
+
+    def remove(self, merchant: str) -> None:
+        self._keys.pop(merchant, None)
+        self._clients.pop(merchant, None)
+
+    def client(self, merchant: str) -> AsynCoinPayments:
+        """
+        the client of a merchant, bound to the shared session, it must be called with a
+        running event loop
+
+        Raises
+        ------
+        CoinPaymentsInputError
+            the merchant is not part of the pool
+        """
+
+        session = self._get_session()
+        client = self._clients.get(merchant)
+
+        if client is None:
+            try:
+                private_key, public_key = self._keys[merchant]
+            except KeyError:
+                raise CoinPaymentsInputError(f"Unknown merchant {merchant}")
+
+            client = AsynCoinPayments(
+                private_key,
+                public_key,
+                scheduler=self.scheduler,
+                retry_policy=self.retry_policy,
+                observers=self.observers,
+                session=session,
+                **self._client_options,
+            )
+            self._clients[merchant] = client
+
+        return client
+
+    async def _fan_out(
+        self, calls: Mapping[str, MerchantCall]
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        async def _run(merchant: str, call: MerchantCall) -> Tuple[str, Any]:
+            try:
+                return merchant, await call(self.client(merchant))
+            except Exception as e:
+                return merchant, e
+
+        tasks = [
+            asyncio.ensure_future(_run(merchant, call))
+            for merchant, call in calls.items()
+        ]
+
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            # the caller stopped early
+            for task in tasks:
+                task.cancel()
+
+    def map(
+        self, call: MerchantCall, merchants: Iterable[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        run call concurrently for every merchant and yield the results as they complete
+
+        Parameters
+        ----------
+        call : MerchantCall
+            a coroutine function called with the client of each merchant
+        merchants : Iterable[str], optional
+            the merchants to run call for, by default all of them
+
+        Yields
+        ------
+        Tuple[str, Any]
+            the merchant and the result of its call, or the exception it raised
+        """
+
+        if merchants is None:
+            merchants = self._keys
+
+        return self._fan_out({merchant: call for merchant in merchants})
+
+    def balances(
+        self, all_coins: bool = False, merchants: Iterable[str] = None
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        the balances of every merchant, yielded as they arrive
+        """
+
+        return self.map(lambda client: client.balances(all_coins=all_coins), merchants)
+
+    def get_tx_info(
+        self, owners: Mapping[str, str], concurrency: int = 4
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """
+        the informations of transactions owned by different merchants, each merchant is
+        queried with get_tx_info_multi for its own txids
+
+        Parameters
+        ----------
+        owners : Mapping[str, str]
+            the txids mapped to the merchant they belong to
+        concurrency : int, optional
+            the maximum number of chunks of 25 txids queried at once per merchant, by default 4
+
+        Yields
+        ------
+        Tuple[str, Any]
+            the merchant and the JsonResponse of its txids, or the exception it raised
+        """
+
+        txids_of = defaultdict(list)
+        for txid, merchant in owners.items():
+            txids_of[merchant].append(txid)
+
+        def _query(txids: list) -> MerchantCall:
+            return lambda client: client.get_tx_info_multi(
+                txids, concurrency=concurrency
+            )
+
+        return self._fan_out(
+            {merchant: _query(txids) for merchant, txids in txids_of.items()}
+        )
@@ -0,0 +1,194 @@
+import time
+from array import array
+from typing import Dict, List, Mapping, Union
+
+from .errors import CoinPaymentsInputError
+from .models import Balance, Rate
+from .utils import JsonResponse
+
+
+class RatesSnapshot:
+    """
+    Indexed, parsed once view of a rates api response
+
+    The btc rates are stored in a compact array of doubles addressed through a
+    currency to index map, the accepted and fiat flags are kept as bitsets, so
+    every lookup and conversion is O(1) and never re-parses the raw strings
+    """
+
+    __slots__ = (
+        "codes",
+        "index",
+        "rate_btc",
+        "accepted_mask",
+        "fiat_mask",
+        "created_at",
+        "_rows",
+    )
+
+    def __init__(self, rates: Mapping[str, Union[dict, Rate]]) -> None:
+        """
+        Parameters
+        ----------
+        rates : Mapping[str, Union[dict, Rate]]
+            the raw or typed result of a rates api call, if the entries carry no accepted flag every currency is considered accepted
+        """
+
+        self.codes: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.rate_btc = array("d")
+        self.accepted_mask = 0
+        self.fiat_mask = 0
+        self.created_at = time.time()
+        # conversion matrix rows, computed once per base currency on demand
+        self._rows: Dict[int, array] = {}
+
+        for i, (code, info) in enumerate(rates.items()):
+            self.codes.append(code)
+            self.index[code] = i
+            if isinstance(info, Rate):
+                rate_btc = info.rate_btc
+                accepted = info.accepted is not False
+                is_fiat = info.is_fiat
+            else:
+                rate_btc = info["rate_btc"]
+                accepted = int(info.get("accepted", 1))
+                is_fiat = int(info.get("is_fiat", 0))
+
+            self.rate_btc.append(float(rate_btc))
+            if accepted:
+                self.accepted_mask |= 1 << i
+            if is_fiat:
+                self.fiat_mask |= 1 << i
+
+    @classmethod
+    def from_response(cls, response: JsonResponse) -> "RatesSnapshot":
+        response.raise_for_errors()
+        return cls(response.result)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __contains__(self, currency: str) -> bool:
+        return currency.upper() in self.index
+
+    def _position(self, currency: str) -> int:
+        try:
+            return self.index[currency.upper()]
+        except KeyError:
+            raise CoinPaymentsInputError(f"Unknown currency {currency}")
+
+    def is_fiat(self, currency: str) -> bool:
+        return bool(self.fiat_mask >> self._position(currency) & 1)
+
+    def is_accepted(self, currency: str, fiat_included: bool = True) -> bool:
+        """
+        Check if a currency is accepted by the merchant
+
+        Parameters
+        ----------
+        currency : str
+            The currency that needs to be checked
+        fiat_included : bool, optional
+            If fiat currencies should be considered accepted, by default True
+        """
+
+        i = self.index.get(currency.upper())
+        if i is None:
+            return False
+
+        return bool(self._accepted(fiat_included) >> i & 1)
+
+    def _accepted(self, fiat_included: bool) -> int:
+        # the rates carry fiat currencies with accepted set to 0, they are listed
+        # with the accepted coins as only their prices are needed
+        if fiat_included:
+            return self.accepted_mask | self.fiat_mask
+        return self.accepted_mask & ~self.fiat_mask
+
+    def accepted_list(self, fiat_included: bool = True) -> List[str]:
+        mask = self._accepted(fiat_included)
+
+        return [code for i, code in enumerate(self.codes) if mask >> i & 1]
+
+    def rate(self, from_currency: str, to_currency: str) -> float:
+        """
+        the value of one unit of from_currency expressed in to_currency
+        """
+
+        i = self._position(from_currency)
+        j = self._position(to_currency)
+
+        return self.rate_btc[i] / self.rate_btc[j]
+
+    def convert(
+        self, from_currency: str, to_currency: str, amount: Union[float, str]
+    ) -> float:
+        """
+        convert an amount of from_currency to to_currency
+
+        Raises
+        ------
+        CoinPaymentsInputError
+            If one of the currencies is not part of the snapshot
+        """
+
+        return float(amount) * self.rate(from_currency, to_currency)
+
+    def _row(self, to_currency: str) -> array:
+        """
+        the conversion matrix row of to_currency, the rate of every currency against it
+        """
+
+        j = self._position(to_currency)
+        row = self._rows.get(j)
+
+        if row is None:
+            base = self.rate_btc[j]
+            row = array("d", (r / base for r in self.rate_btc))
+            self._rows[j] = row
+
+        return row
+
+    def convert_balances(
+        self,
+        balances: Mapping[str, Union[dict, Balance, float, str]],
+        to_currency: str,
+        only_accepted: bool = False,
+    ) -> Dict[str, float]:
+        """
+        convert a whole balances result in one pass
+
+        Parameters
+        ----------
+        balances : Mapping[str, Union[dict, Balance, float, str]]
+            the raw or typed result of a balances api call or a mapping of currencies to amounts
+        to_currency : str
+            The currency in which the balances will be returned
+        only_accepted : bool, optional
+            If set to True only the balances of the accepted currencies are converted, by default False
+
+        Returns
+        -------
+        Dict[str, float]
+            the converted balances, currencies missing from the snapshot are skipped
+        """
+
+        row = self._row(to_currency)
+        index = self.index
+        accepted_mask = self.accepted_mask
+        converted = {}
+
+        for coin, balance in balances.items():
+            i = index.get(coin)
+            if i is None or (only_accepted and not accepted_mask >> i & 1):
+                continue
+
+            if isinstance(balance, Mapping):
+                balance = balance["balancef"]
+            elif isinstance(balance, Balance):
+                balance = balance.amount
+
+            converted[coin] = float(balance) * row[i]
+
+        return converted
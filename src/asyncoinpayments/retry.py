@@ -0,0 +1,97 @@
+import asyncio
+from typing import FrozenSet, Iterable
+
+import aiohttp
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_random_exponential,
+)
+
+from .commands import NON_IDEMPOTENT_COMMANDS
+
+
+class RetryPolicy:
+    """
+    Decides which failed requests are retried and how long to wait between attempts
+
+    Only transient failures are retried (connection errors, timeouts and 5xx
+    responses) with exponential backoff and full jitter, within a total time
+    budget. Non idempotent commands are retried only when the connection could not
+    be established, since then the request never reached the api
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 4.0,
+        budget: float = 10.0,
+        non_idempotent: Iterable[str] = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        max_attempts : int, optional
+            the maximum number of attempts of a request, by default 3
+        base_delay : float, optional
+            the base of the exponential backoff in seconds, by default 0.25
+        max_delay : float, optional
+            the maximum wait between two attempts in seconds, by default 4.0
+        budget : float, optional
+            no new attempt is made once this many seconds have passed since the first one, by default 10.0
+        non_idempotent : Iterable[str], optional
+            the commands that must not be sent twice, by default NON_IDEMPOTENT_COMMANDS
+        """
+
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.non_idempotent: FrozenSet[str] = (
+            frozenset(non_idempotent)
+            if non_idempotent is not None
+            else NON_IDEMPOTENT_COMMANDS
+        )
+
+    def is_idempotent(self, cmd: str) -> bool:
+        return cmd not in self.non_idempotent
+
+    @staticmethod
+    def is_transient(exc: BaseException) -> bool:
+        """
+        check if exc is a failure worth retrying
+        """
+
+        if isinstance(exc, aiohttp.ClientResponseError):
+            return exc.status >= 500
+        return isinstance(
+            exc,
+            (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ),
+        )
+
+    def should_retry(self, cmd: str, exc: BaseException) -> bool:
+        if self.is_idempotent(cmd):
+            return self.is_transient(exc)
+        # the request was never sent, so it can't have been executed
+        return isinstance(exc, aiohttp.ClientConnectorError)
+
+    def retrying(self, cmd: str) -> AsyncRetrying:
+        """
+        build the tenacity retrying loop of a single cmd request
+        """
+
+        return AsyncRetrying(
+            stop=stop_after_attempt(self.max_attempts) | stop_after_delay(self.budget),
+            wait=wait_random_exponential(
+                multiplier=self.base_delay, max=self.max_delay
+            ),
+            retry=retry_if_exception(lambda exc: self.should_retry(cmd, exc)),
+            reraise=True,
+        )
@@ -0,0 +1,222 @@
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from .commands import COMMAND_PRIORITIES, PRIORITY_NORMAL
+
+
+def is_rate_limited(error: str) -> bool:
+    """
+    check if an api error message reports that the requests are being throttled
+    """
+
+    error = error.lower()
+    return "rate limit" in error or "too many" in error
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at a constant rate, the rate can be scaled down at runtime
+    """
+
+    def __init__(self, rate: float, burst: float = None) -> None:
+        """
+        Parameters
+        ----------
+        rate : float
+            the number of tokens added per second
+        burst : float, optional
+            the capacity of the bucket, by default rate
+        """
+
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self.factor = 1.0  # scales the refill rate while backing off
+
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate * self.factor
+        )
+        self._updated = now
+
+    def delay(self, weight: float) -> float:
+        """
+        seconds to wait before weight tokens are available, 0 if they already are
+        """
+
+        self._refill()
+        missing = min(weight, self.burst) - self._tokens
+
+        if missing <= 0:
+            return 0.0
+        return missing / (self.rate * self.factor)
+
+    def consume(self, weight: float) -> None:
+        self._refill()
+        self._tokens -= min(weight, self.burst)
+
+
+class RequestScheduler:
+    """
+    Client side limiter of the api calls
+
+    Every call waits for a slot under the max in flight limit and for its weight in
+    tokens of a token bucket, waiting calls are served by priority lane then by
+    arrival order. When the api reports throttling the refill rate is cut
+    multiplicatively and then recovers additively on every successful call
+    """
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: float = None,
+        max_in_flight: int = 20,
+        weights: Dict[str, float] = None,
+        priorities: Dict[str, int] = None,
+        backoff_factor: float = 0.5,
+        min_factor: float = 0.05,
+        recovery_step: float = 0.05,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        rate : float, optional
+            the sustained number of requests per second, by default 10.0
+        burst : float, optional
+            the number of requests that can be sent at once after an idle period, by default rate
+        max_in_flight : int, optional
+            the maximum number of requests awaiting a response, by default 20
+        weights : Dict[str, float], optional
+            the number of tokens consumed by each cmd, by default 1 for every cmd
+        priorities : Dict[str, int], optional
+            the priority lane of each cmd, merged over the defaults, by default None
+        backoff_factor : float, optional
+            the factor applied to the rate when the api throttles us, by default 0.5
+        min_factor : float, optional
+            the rate is never scaled below this fraction, by default 0.05
+        recovery_step : float, optional
+            the fraction of the rate recovered on each successful call, by default 0.05
+        """
+
+        self.bucket = TokenBucket(rate, burst)
+        self.max_in_flight = max_in_flight
+        self.weights = weights or {}
+        self.priorities = dict(COMMAND_PRIORITIES)
+        if priorities:
+            self.priorities.update(priorities)
+
+        self.backoff_factor = backoff_factor
+        self.min_factor = min_factor
+        self.recovery_step = recovery_step
+
+        self.in_flight = 0
+        # (priority, arrival, weight, future)
+        self._waiters: list = []
+        self._arrivals = itertools.count()
+        self._timer: asyncio.TimerHandle = None
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def _dispatch(self) -> None:
+        """
+        grant the waiting calls that can proceed, in priority order
+        """
+
+        self._timer = None
+        waiters = self._waiters
+
+        while waiters:
+            _, _, weight, future = waiters[0]
+
+            if future.done():  # cancelled while waiting
+                heapq.heappop(waiters)
+                continue
+
+            if self.in_flight >= self.max_in_flight:
+                return
+
+            delay = self.bucket.delay(weight)
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(
+                    delay, self._dispatch
+                )
+                return
+
+            heapq.heappop(waiters)
+            self.bucket.consume(weight)
+            self.in_flight += 1
+            future.set_result(None)
+
+    async def acquire(self, cmd: str, priority: int = None) -> None:
+        """
+        wait until cmd is allowed to be sent, every acquire must be paired with a
+        release. The call waits in the lane of cmd unless a priority is passed
+        """
+
+        if priority is None:
+            priority = self.priorities.get(cmd, PRIORITY_NORMAL)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (
+            priority,
+            next(self._arrivals),
+            self.weights.get(cmd, 1),
+            future,
+        )
+        heapq.heappush(self._waiters, entry)
+
+        if self._timer is None:
+            self._dispatch()
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            # the slot was granted right before the cancellation
+            if future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+
+        if self._timer is None:
+            self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, cmd: str, priority: int = None) -> AsyncIterator[None]:
+        await self.acquire(cmd, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def penalize(self) -> None:
+        """
+        slow down after the api reported that we are being throttled
+        """
+
+        bucket = self.bucket
+        bucket._refill()
+        bucket.factor = max(self.min_factor, bucket.factor * self.backoff_factor)
+
+    def record_success(self) -> None:
+        bucket = self.bucket
+        if bucket.factor < 1.0:
+            bucket._refill()
+            bucket.factor = min(1.0, bucket.factor + self.recovery_step)
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "queued": len(self._waiters),
+            "rate": self.bucket.rate * self.bucket.factor,
+        }
@@ -0,0 +1,79 @@
+import hashlib
+import hmac
+from functools import lru_cache
+from typing import Any, Dict, Mapping
+from urllib.parse import quote_plus, urlencode
+
+
+@lru_cache(maxsize=1024)
+def _quote_key(key: str) -> str:
+    return quote_plus(key)
+
+
+def _quote_value(value: Any) -> str:
+    # ints never need quoting, everything else is quoted exactly like urlencode does
+    if type(value) is int:
+        return str(value)
+    if isinstance(value, bytes):
+        return quote_plus(value)
+    return quote_plus(str(value))
+
+
+def encode_params(params: Mapping[str, Any]) -> str:
+    """
+    form encode params, same output as urllib.parse.urlencode for flat mappings
+    """
+
+    return "&".join(
+        f"{_quote_key(str(key))}={_quote_value(value)}" for key, value in params.items()
+    )
+
+
+class RequestSigner:
+    """
+    Encodes and signs the api requests
+
+    The hmac is keyed once and copied for every request, and the constant head of
+    the body (cmd, key, version and format) is encoded once per cmd, so only the
+    variable params of a request are encoded
+    """
+
+    def __init__(
+        self, private_key: str, public_key: str, version: str, _format: str
+    ) -> None:
+        self._hmac = hmac.new(private_key.encode("utf-8"), digestmod=hashlib.sha512)
+        self._public_key = public_key
+        self._version = version
+        self._format = _format
+        self._prefixes: Dict[str, bytes] = {}
+
+    def prefix(self, cmd: str) -> bytes:
+        prefix = self._prefixes.get(cmd)
+
+        if prefix is None:
+            prefix = urlencode(
+                {
+                    "cmd": cmd,
+                    "key": self._public_key,
+                    "version": self._version,
+                    "format": self._format,
+                }
+            ).encode("utf-8")
+            self._prefixes[cmd] = prefix
+
+        return prefix
+
+    def encode(self, cmd: str, params: Mapping[str, Any]) -> bytes:
+        """
+        the request body of an api call of cmd with params
+        """
+
+        if not params:
+            return self.prefix(cmd)
+
+        return self.prefix(cmd) + b"&" + encode_params(params).encode("utf-8")
+
+    def sign(self, encoded: bytes) -> str:
+        h = self._hmac.copy()
+        h.update(encoded)
+        return h.hexdigest()
@@ -1,7 +1,26 @@
-from typing import TypedDict
+import json
+import re
+from itertools import islice
+from typing import Any, Callable, Dict, Iterable, Iterator, List, TypedDict
 
 from .errors import CoinPayementsError
 
+# the fastest available json decoder, all of them decode straight from bytes
+try:
+    import orjson
+
+    json_loads: Callable[[bytes], Any] = orjson.loads
+except ImportError:
+    try:
+        import msgspec
+
+        json_loads = msgspec.json.decode
+    except ImportError:
+        json_loads = json.loads
+
+# matches the error field the api puts first in its responses, as long as it has no escapes
+_ERROR_PREFIX = re.compile(rb'\s*\{\s*"error"\s*:\s*"([^"\\]*)"')
+
 
 class ResponseFormat:
     JSON = "json"
@@ -14,6 +33,11 @@ class ApiResponseJson(TypedDict):
 
 
 class JsonResponse:
+    # set on the responses served from a warm start file before the live ones arrived
+    stale = False
+    # kind -> the typed copy of the response, see AsynCoinPayments._typed
+    _parsed: Dict[str, "JsonResponse"] = None
+
     def __init__(self, data: ApiResponseJson) -> None:
         self.error = data["error"]
         self.result = data["result"]
@@ -27,3 +51,49 @@ class JsonResponse:
         """
         if self.error != "ok":
             raise CoinPayementsError(self.error)
+
+
+class LazyJsonResponse(JsonResponse):
+    """
+    JsonResponse built from the raw response body, the body is decoded only when
+    result is first accessed, the error is read from the start of the body when possible
+    """
+
+    def __init__(self, raw: bytes, loads: Callable[[bytes], Any] = json_loads) -> None:
+        self._raw = raw
+        self._loads = loads
+        self._data: ApiResponseJson = None
+        self._error: str = None
+
+    def _decode(self) -> ApiResponseJson:
+        if self._data is None:
+            self._data = self._loads(self._raw)
+            self._raw = None
+        return self._data
+
+    @property
+    def error(self) -> str:
+        if self._error is None:
+            match = _ERROR_PREFIX.match(self._raw) if self._data is None else None
+            if match:
+                self._error = match.group(1).decode("utf-8")
+            else:
+                self._error = self._decode()["error"]
+        return self._error
+
+    @property
+    def result(self) -> dict:
+        return self._decode()["result"]
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    split an iterable in lists of at most size elements
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,217 @@
+"""
+On disk copy of the last good responses of the slow changing commands
+
+A restarted process serves rates and get_basic_info from the file right away, marked
+stale, while the live responses are fetched in the background. The file is a small
+binary index followed by the json payloads: loading it only walks the index through
+mmap, a payload is decoded the first time it is served
+"""
+
+import asyncio
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from .commands import WARM_START_COMMANDS
+from .signing import encode_params
+from .utils import ApiResponseJson
+from .utils import json_loads as default_json_loads
+
+MAGIC = b"ACPW"
+FORMAT_VERSION = 2
+# magic, format version, number of entries
+HEADER = struct.Struct("<4sHI")
+# key length, saved at, payload length
+ENTRY = struct.Struct("<HdI")
+
+
+class _Entry:
+    __slots__ = ("payload", "saved_at", "data")
+
+    def __init__(self, payload: bytes, saved_at: float) -> None:
+        self.payload = payload
+        self.saved_at = saved_at
+        self.data: ApiResponseJson = None  # decoded on first use
+
+
+class WarmStart:
+    """
+    The last good response of each call of the warm start commands, keyed by
+    merchant, cmd and params, loaded from ``path`` when built
+
+    A loaded response stays stale until a live response of the same call replaces
+    it, or until it is older than max_age and is no longer served. Live responses
+    are written back to the file at most every save_interval seconds and when the
+    client is closed. The clients of several merchants, such as those of a pool,
+    can share one instance
+    """
+
+    def __init__(
+        self,
+        path: str,
+        commands: Iterable[str] = None,
+        save_interval: float = 30.0,
+        json_loads: Callable[[bytes], Any] = None,
+        max_age: float = None,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        path : str
+            the snapshot file, it is created on the first save
+        commands : Iterable[str], optional
+            the commands whose responses are kept, by default rates and get_basic_info
+        save_interval : float, optional
+            the minimum number of seconds between two writes of the file, by default 30.0
+        json_loads : Callable[[bytes], Any], optional
+            the function decoding the payloads, by default the one of the client
+        max_age : float, optional
+            the loaded responses saved more than this many seconds ago are not served, by default None
+        """
+
+        self.path = path
+        self.commands = (
+            frozenset(commands) if commands is not None else WARM_START_COMMANDS
+        )
+        self.save_interval = save_interval
+        self._loads = json_loads or default_json_loads
+        self.max_age = max_age
+
+        self._entries: Dict[str, _Entry] = {}
+        self._fresh: set = set()  # keys answered live since the file was loaded
+        self._save_handle: asyncio.TimerHandle = None
+        self._saving: asyncio.Future = None
+
+        self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(cmd: str, params: Dict[str, Any], public_key: str = "") -> str:
+        # get_basic_info and the accepted rates differ between merchants
+        return f"{public_key}:{cmd}?{encode_params(params)}"
+
+    def load(self) -> None:
+        """
+        read the index of the file, a missing, foreign or truncated file is ignored
+        """
+
+        try:
+            with open(self.path, "rb") as f, mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ
+            ) as view:
+                entries = self._parse(view)
+        except (OSError, ValueError, struct.error):
+            return
+
+        for key, entry in entries.items():
+            self._entries.setdefault(key, entry)
+
+    @staticmethod
+    def _parse(view: mmap.mmap) -> Dict[str, _Entry]:
+        magic, version, count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            return {}
+
+        entries: Dict[str, _Entry] = {}
+        offset = HEADER.size
+        for _ in range(count):
+            key_length, saved_at, length = ENTRY.unpack_from(view, offset)
+            offset += ENTRY.size
+            key = view[offset : offset + key_length].decode("utf-8")
+            offset += key_length
+            payload = view[offset : offset + length]
+            if len(payload) != length:
+                raise ValueError("truncated snapshot")
+            offset += length
+            entries[key] = _Entry(payload, saved_at)
+
+        return entries
+
+    def stale(self, key: str) -> Optional[Tuple[ApiResponseJson, float]]:
+        """
+        the loaded response of key and when it was saved, None once a live response
+        replaced it or when it is older than max_age
+        """
+
+        if key in self._fresh:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        if self.max_age is not None and time.time() - entry.saved_at > self.max_age:
+            return None
+
+        if entry.data is None:
+            try:
+                entry.data = self._loads(entry.payload)
+            except ValueError:
+                del self._entries[key]
+                return None
+
+        return entry.data, entry.saved_at
+
+    def put(self, key: str, data: ApiResponseJson) -> None:
+        """
+        keep the live response of key, the file is written later
+        """
+
+        entry = _Entry(
+            json.dumps(data, separators=(",", ":")).encode("utf-8"), time.time()
+        )
+        entry.data = data
+        self._entries[key] = entry
+        self._fresh.add(key)
+
+        if self._save_handle is None:
+            self._save_handle = asyncio.get_running_loop().call_later(
+                self.save_interval, self._schedule_save
+            )
+
+    def _schedule_save(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._saving is not None and not self._saving.done():
+            # the previous write is still running, try again later
+            self._save_handle = loop.call_later(self.save_interval, self._schedule_save)
+            return
+
+        self._save_handle = None
+        self._saving = loop.run_in_executor(None, self._write, self._records())
+
+    def _records(self) -> List[Tuple[str, _Entry]]:
+        # taken on the event loop thread, the writer only sees this copy
+        return list(self._entries.items())
+
+    def _write(self, records: List[Tuple[str, _Entry]]) -> None:
+        chunks = [HEADER.pack(MAGIC, FORMAT_VERSION, len(records))]
+        for key, entry in records:
+            raw_key = key.encode("utf-8")
+            chunks.append(ENTRY.pack(len(raw_key), entry.saved_at, len(entry.payload)))
+            chunks.append(raw_key)
+            chunks.append(entry.payload)
+
+        # other processes may share the file, each one replaces it atomically
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(chunks))
+        os.replace(tmp, self.path)
+
+    async def flush(self) -> None:
+        """
+        write the pending live responses now
+        """
+
+        if self._saving is not None:
+            await self._saving
+
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write, self._records())
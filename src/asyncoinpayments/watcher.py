@@ -0,0 +1,302 @@
+import asyncio
+import heapq
+import logging
+import time
+from typing import Dict, List, Optional
+
+from .coinpayments import AsynCoinPayments
+from .errors import CoinPayementsError
+from .models import is_final_status
+
+logger = logging.getLogger(__name__)
+
+# status of a payment that received its funds and waits for confirmations
+STATUS_CONFIRMING = 1
+
+
+class TxStatusEvent:
+    __slots__ = ("txid", "status", "status_text", "previous_status", "info")
+
+    def __init__(
+        self,
+        txid: str,
+        status: int,
+        status_text: str,
+        previous_status: Optional[int],
+        info: dict,
+    ) -> None:
+        self.txid = txid
+        self.status = status
+        self.status_text = status_text
+        self.previous_status = previous_status  # None on the first observation
+        self.info = info  # the raw get_tx_info result or the ipn fields
+
+    def __repr__(self) -> str:
+        return (
+            f"TxStatusEvent(txid={self.txid!r}, status={self.status}, "
+            f"previous_status={self.previous_status})"
+        )
+
+    @property
+    def is_final(self) -> bool:
+        return is_final_status(self.status)
+
+
+class _Tracked:
+    __slots__ = ("status", "added", "due", "failures")
+
+    def __init__(self, status: Optional[int], added: float) -> None:
+        self.status = status
+        self.added = added
+        self.due = added
+        self.failures = 0
+
+
+class TransactionWatcher:
+    """
+    Tracks pending payments until they reach a final status
+
+    The due transactions are polled together through get_tx_info_multi. A payment
+    waiting for its funds is polled less and less often as it ages, a payment whose
+    funds arrived is polled every min_interval until it is confirmed, and a payment
+    reaching a final status stops being watched. Every status change is published as a
+    TxStatusEvent through the async iterator of the watcher. IPNs can be pushed with
+    notify_ipn so that the next poll of that payment is postponed or skipped
+    """
+
+    def __init__(
+        self,
+        client: AsynCoinPayments,
+        min_interval: float = 15.0,
+        max_interval: float = 600.0,
+        age_factor: float = 0.1,
+        max_batch: int = 500,
+        concurrency: int = 4,
+    ) -> None:
+        """
+        Parameters
+        ----------
+        client : AsynCoinPayments
+            the client of the merchant owning the transactions
+        min_interval : float, optional
+            the shortest wait in seconds between two polls of a transaction, by default 15.0
+        max_interval : float, optional
+            the longest wait in seconds between two polls of a transaction, by default 600.0
+        age_factor : float, optional
+            a payment waiting for funds is polled every age * age_factor seconds, within the bounds, by default 0.1
+        max_batch : int, optional
+            the maximum number of transactions polled in one round, by default 500
+        concurrency : int, optional
+            the maximum number of get_tx_info_multi calls in flight, by default 4
+        """
+
+        self.client = client
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.age_factor = age_factor
+        self.max_batch = max_batch
+        self.concurrency = concurrency
+
+        self._tracked: Dict[str, _Tracked] = {}
+        self._schedule: List[tuple] = []  # (due, txid), stale entries are skipped
+        # created on first use, before python 3.10 they bind to the event loop
+        # current when they are built
+        self._events: asyncio.Queue = None
+        self._wakeup: asyncio.Event = None
+        self._task: asyncio.Task = None
+
+    def __len__(self) -> int:
+        return len(self._tracked)
+
+    def __contains__(self, txid: str) -> bool:
+        return txid in self._tracked
+
+    def _reschedule(self, txid: str, tracked: _Tracked, due: float) -> None:
+        tracked.due = due
+        heapq.heappush(self._schedule, (due, txid))
+
+    def interval(self, status: Optional[int], age: float) -> float:
+        """
+        seconds to wait before polling again a transaction of the given status and age
+        """
+
+        if status == STATUS_CONFIRMING:
+            return self.min_interval
+
+        return min(self.max_interval, max(self.min_interval, age * self.age_factor))
+
+    def watch(self, txid: str, status: int = None) -> None:
+        """
+        start watching txid, it is polled as soon as possible
+
+        Parameters
+        ----------
+        txid : str
+            the payment id, as returned by create_transaction
+        status : int, optional
+            the last known status, an event is published only when it changes, by default None
+        """
+
+        if txid in self._tracked:
+            return
+
+        tracked = _Tracked(status, time.monotonic())
+        self._tracked[txid] = tracked
+        self._reschedule(txid, tracked, tracked.added)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def unwatch(self, txid: str) -> None:
+        self._tracked.pop(txid, None)
+
+    def _update(self, txid: str, status: int, status_text: str, info: dict) -> None:
+        tracked = self._tracked.get(txid)
+        if tracked is None:
+            return
+
+        tracked.failures = 0
+        if status != tracked.status:
+            self._queue().put_nowait(
+                TxStatusEvent(txid, status, status_text, tracked.status, info)
+            )
+            tracked.status = status
+
+        if is_final_status(status):
+            del self._tracked[txid]
+            return
+
+        now = time.monotonic()
+        self._reschedule(
+            txid, tracked, now + self.interval(status, now - tracked.added)
+        )
+
+    def notify_ipn(self, event) -> None:
+        """
+        push the status carried by an IPN, an asyncoinpayments.ipn.IpnEvent, the
+        transaction is then not polled again before its next interval
+        """
+
+        if event.txn_id in self._tracked:
+            self._update(event.txn_id, event.status, event.status_text, event.fields)
+
+    def _pop_due(self) -> List[str]:
+        now = time.monotonic()
+        due = []
+
+        while self._schedule and len(due) < self.max_batch:
+            when, txid = self._schedule[0]
+            tracked = self._tracked.get(txid)
+
+            if tracked is None or tracked.due != when:  # stale entry
+                heapq.heappop(self._schedule)
+                continue
+            if when > now:
+                break
+
+            heapq.heappop(self._schedule)
+            due.append(txid)
+
+        return due
+
+    async def _poll(self, txids: List[str]) -> None:
+        try:
+            response = await self.client.get_tx_info_multi(
+                txids, concurrency=self.concurrency
+            )
+            results = response.result
+        except CoinPayementsError as e:
+            logger.warning("polling %d transactions failed: %s", len(txids), e)
+            results = {}
+
+        now = time.monotonic()
+        for txid in txids:
+            info = results.get(txid)
+
+            if info is not None and info.get("error", "ok") == "ok":
+                self._update(
+                    txid, int(info["status"]), info.get("status_text", ""), info
+                )
+                continue
+
+            self._backoff(txid, now)
+
+    def _backoff(self, txid: str, now: float) -> None:
+        """
+        poll txid again later after a failure, with an exponential backoff
+        """
+
+        tracked = self._tracked.get(txid)
+        if tracked is not None:
+            tracked.failures += 1
+            delay = min(self.max_interval, self.min_interval * 2**tracked.failures)
+            self._reschedule(txid, tracked, now + delay)
+
+    async def _run(self) -> None:
+        while True:
+            due = self._pop_due()
+
+            if due:
+                try:
+                    await self._poll(due)
+                except Exception:
+                    # a malformed response must not end the watcher
+                    logger.exception("polling %d transactions failed", len(due))
+                    now = time.monotonic()
+                    for txid in due:
+                        tracked = self._tracked.get(txid)
+                        # the ones updated before the failure are already rescheduled
+                        if tracked is not None and tracked.due <= now:
+                            self._backoff(txid, now)
+                continue
+
+            self._wakeup.clear()
+            timeout = None
+            if self._schedule:
+                timeout = max(0.0, self._schedule[0][0] - time.monotonic())
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _queue(self) -> asyncio.Queue:
+        if self._events is None:
+            self._events = asyncio.Queue()
+        return self._events
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._queue()
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        """
+        stop polling and end the iteration over the events
+        """
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        self._queue().put_nowait(None)
+
+    async def __aenter__(self) -> "TransactionWatcher":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def __aiter__(self) -> "TransactionWatcher":
+        return self
+
+    async def __anext__(self) -> TxStatusEvent:
+        event = await self._queue().get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
@@ -0,0 +1,104 @@
+"""
+Incremental parsing of the XML responses into the same structures as the json ones
+
+Every element is turned into a python value as soon as it ends and then cleared, so
+the raw body is never held as a whole and the element tree never grows past the
+element being parsed. Elements with children become dicts keyed by the child tags,
+or lists when all their children share the same tag, and leaves become strings
+"""
+
+from typing import AsyncIterable, Iterable, List, Tuple, Union
+from xml.etree.ElementTree import Element, XMLPullParser
+
+from .utils import ApiResponseJson
+
+XmlValue = Union[dict, list, str]
+
+
+class _Frame:
+    __slots__ = ("element", "children")
+
+    def __init__(self, element: Element) -> None:
+        self.element = element
+        self.children: List[Tuple[str, XmlValue]] = []
+
+    def value(self, text: str) -> XmlValue:
+        children = self.children
+
+        if not children:
+            return (text or "").strip()
+
+        if len(children) > 1 and all(tag == children[0][0] for tag, _ in children):
+            return [value for _, value in children]
+
+        return dict(children)
+
+
+class XmlResponseParser:
+    """
+    Push parser of an api XML response, fed with the chunks of the body as they arrive
+    """
+
+    def __init__(self) -> None:
+        self._parser = XMLPullParser(events=("start", "end"))
+        self._stack: List[_Frame] = []
+        self._root: XmlValue = None
+
+    def feed(self, chunk: bytes) -> None:
+        self._parser.feed(chunk)
+        self._consume()
+
+    def _consume(self) -> None:
+        stack = self._stack
+
+        for event, element in self._parser.read_events():
+            if event == "start":
+                stack.append(_Frame(element))
+                continue
+
+            value = stack.pop().value(element.text)
+            # the converted element is not needed anymore
+            element.clear()
+
+            if stack:
+                parent = stack[-1]
+                # its earlier siblings are already gone, it is found right away
+                parent.element.remove(element)
+                parent.children.append((element.tag, value))
+            else:
+                self._root = value
+
+    def close(self) -> ApiResponseJson:
+        """
+        end the parsing and return the response as an error and result dict
+        """
+
+        self._parser.close()
+        self._consume()
+
+        root = self._root if isinstance(self._root, dict) else {}
+        result = root.get("result", {})
+        # an empty result element is an empty result, not an empty string
+        if result == "":
+            result = {}
+
+        return {"error": root.get("error", ""), "result": result}
+
+
+def parse_xml(chunks: Iterable[bytes]) -> ApiResponseJson:
+    parser = XmlResponseParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
+
+
+async def parse_xml_stream(chunks: AsyncIterable[bytes]) -> ApiResponseJson:
+    """
+    parse an XML response from the chunks of its body, such as
+    aiohttp.ClientResponse.content.iter_chunked
+    """
+
+    parser = XmlResponseParser()
+    async for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close()
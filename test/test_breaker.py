@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from asyncoinpayments import AsynCoinPayments, CircuitBreaker
+from asyncoinpayments.breaker import CLOSED, OPEN
+from asyncoinpayments.errors import CircuitOpenError
+
+
+def slow_client(breaker, delay):
+    # not coalesced, the callers' deadlines apply to the requests themselves
+    client = AsynCoinPayments("private", "public", breaker=breaker, coalesce=False)
+
+    async def request_once(method, encoded, timings=None):
+        await asyncio.sleep(delay)
+        return {"error": "ok", "result": {}}
+
+    client._request_once = request_once
+    return client
+
+
+def test_timeouts_open_the_circuit():
+    breaker = CircuitBreaker(min_calls=10, slow_call_duration=5.0)
+    client = slow_client(breaker, delay=1.0)
+
+    async def run():
+        for _ in range(10):
+            with pytest.raises(asyncio.TimeoutError):
+                await client.api_call("balances", timeout=0.01)
+
+        # the timeouts were recorded as failed and slow calls, far under 5 seconds
+        circuit = breaker.circuit("balances")
+        assert circuit.state == OPEN
+        assert circuit.in_flight == 0
+
+        with pytest.raises(CircuitOpenError):
+            await client.api_call("balances", timeout=0.01)
+
+    asyncio.run(run())
+
+
+def test_cancelled_call_has_no_outcome():
+    breaker = CircuitBreaker(min_calls=1)
+    client = slow_client(breaker, delay=1.0)
+
+    async def run():
+        call = asyncio.ensure_future(client.api_call("balances", timeout=10.0))
+        await asyncio.sleep(0.01)
+        call.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await call
+
+        circuit = breaker.circuit("balances")
+        assert circuit.state == CLOSED
+        assert len(circuit.outcomes) == 0
+        assert circuit.in_flight == 0
+
+    asyncio.run(run())
@@ -0,0 +1,114 @@
+import asyncio
+
+import pytest
+
+from asyncoinpayments.errors import CoinPayementsError
+from asyncoinpayments.ledger import Ledger
+from asyncoinpayments.utils import JsonResponse
+
+
+def tx(time_created):
+    return {"status": 100, "status_text": "Complete", "time_created": time_created}
+
+
+def wd(withdrawal_id, time_created, status=2):
+    return {"id": withdrawal_id, "status": status, "time_created": time_created}
+
+
+class FakeClient:
+    def __init__(self):
+        self.transactions = {}
+        self.failing = set()  # txids whose detail fetch errors
+        self.withdrawals = []
+        self.history_error = None  # raised after the whole history was walked
+        self.tx_newer_than = []
+        self.wd_newer_than = []
+        self.wd_info_calls = []
+
+    async def iter_tx_ids(self, newer_than=0):
+        self.tx_newer_than.append(newer_than)
+        for txid, info in self.transactions.items():
+            if info["time_created"] >= newer_than:
+                yield txid
+
+    async def get_tx_info_multi(self, txids, concurrency=4):
+        result = {
+            txid: (
+                {"error": "timeout"}
+                if txid in self.failing
+                else {"error": "ok", **self.transactions[txid]}
+            )
+            for txid in txids
+        }
+        return JsonResponse({"error": "ok", "result": result})
+
+    async def iter_withdrawal_history(self, newer_than=0):
+        self.wd_newer_than.append(newer_than)
+        for withdrawal in self.withdrawals:
+            if withdrawal["time_created"] >= newer_than:
+                yield withdrawal
+        if self.history_error is not None:
+            raise self.history_error
+
+    async def get_withdrawal_info(self, withdrawal_id, typed=False):
+        self.wd_info_calls.append(withdrawal_id)
+        return JsonResponse({"error": "not found", "result": []})
+
+
+def test_failed_transaction_keeps_the_watermark(tmp_path):
+    client = FakeClient()
+    client.transactions = {"old": tx(100), "new": tx(200)}
+    client.failing = {"old"}
+
+    async def run():
+        async with Ledger(client, str(tmp_path / "ledger.sqlite3")) as ledger:
+            assert await ledger._sync_transactions() == 1
+            assert await ledger._run(ledger._watermark, "transactions") == 0
+
+            # the failed transaction is fetched again on the next sync
+            client.failing = set()
+            assert await ledger._sync_transactions() == 1
+            assert client.tx_newer_than == [0, 0]
+            assert await ledger._run(ledger._watermark, "transactions") == 200
+
+            stored = await ledger.transactions()
+            assert sorted(t.txid for t in stored) == ["new", "old"]
+
+    asyncio.run(run())
+
+
+def test_failed_history_walk_keeps_the_watermark(tmp_path):
+    client = FakeClient()
+    client.withdrawals = [wd(str(i), 1000 - i) for i in range(3)]
+    client.history_error = CoinPayementsError("timeout")
+
+    async def run():
+        path = str(tmp_path / "ledger.sqlite3")
+        async with Ledger(client, path, batch_size=2) as ledger:
+            with pytest.raises(CoinPayementsError):
+                await ledger._sync_withdrawals()
+            # the first batch was written, the watermark didn't move
+            assert len(await ledger.withdrawals()) == 2
+            assert await ledger._run(ledger._watermark, "withdrawals") == 0
+
+            client.history_error = None
+            assert await ledger._sync_withdrawals() == 3
+            assert await ledger._run(ledger._watermark, "withdrawals") == 1000
+
+    asyncio.run(run())
+
+
+def test_pending_withdrawals_in_the_history_are_not_refetched(tmp_path):
+    client = FakeClient()
+    client.withdrawals = [wd(str(i), 1000 - i, status=0) for i in range(3)]
+
+    async def run():
+        path = str(tmp_path / "ledger.sqlite3")
+        async with Ledger(client, path, batch_size=1) as ledger:
+            assert await ledger._sync_withdrawals() == 3
+
+            # the overlap walks 0 and 1 again in separate batches, only 2 is fetched
+            assert await ledger._sync_withdrawals() == 2
+            assert client.wd_info_calls == ["2"]
+
+    asyncio.run(run())